@@ -46,7 +46,8 @@ class EventLocationAdmin(admin.ModelAdmin):
     unless explicitly specified.
     """
 
-    fieldsets = ((None, {"fields": ("title", "address", "postal_code", "city", "room", "mappable_location", "lat", "lon", "description", "link" )}),)
+    fieldsets = ((None, {"fields": ("title", "address", "postal_code", "city", "room", "mappable_location", "lat", "lon", "geocode_status", "description", "link" )}),)
+    readonly_fields = ("geocode_status",)
 
     def in_menu(self):
         """
@@ -0,0 +1,224 @@
+"""
+Per-site caching helpers for the agenda.
+
+Site domains and excluded keywords are resolved once per process, until
+any process changes them: process caches are tied to a generation token
+shared through the cache, which costs a cache read per lookup. Hits
+and misses of the agenda caches are counted per process in
+``cache_stats``. Cached values are keyed on a per-site generation
+token. Changing agenda content bumps the token, which invalidates every
+dependent key with a single cache write.
+"""
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from hashlib import md5
+from uuid import uuid4
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+
+from mezzanine.conf import settings
+from mezzanine.generic.models import Keyword
+from mezzanine.utils.sites import current_site_id
+
+
+_process_caches = {}
+
+cache_stats = defaultdict(int)
+
+
+def record_cache_access(name, hits=0, misses=0):
+    """
+    Count cache hits and misses for the cache ``name``.
+    """
+    cache_stats["%s_hits" % name] += hits
+    cache_stats["%s_misses" % name] += misses
+
+
+def get_cache_stats():
+    """
+    Return the hit and miss counts of each cache along with its hit
+    rate.
+    """
+    stats = dict(cache_stats)
+    for key in list(stats):
+        if key.endswith("_hits"):
+            name = key[:-len("_hits")]
+            total = stats[key] + stats.get("%s_misses" % name, 0)
+            stats["%s_hit_rate" % name] = float(stats[key]) / total if total else 0.0
+    return stats
+
+
+def get_site_domain(site_id=None):
+    """
+    Return the domain of the given site, querying each site only once
+    per process until ``clear_site_domains`` is called.
+    """
+    if site_id is None:
+        site_id = current_site_id()
+    site_domains = process_cache("site_domains")
+    try:
+        return site_domains[site_id]
+    except KeyError:
+        domain = Site.objects.get(id=site_id).domain
+        site_domains[site_id] = domain
+        return domain
+
+
+def clear_site_domains():
+    """
+    Forget the domains resolved by ``get_site_domain`` in every process.
+    """
+    invalidate_scope("site_domains")
+
+
+def get_excluded_keyword_ids():
+    """
+    Return the ids of the keywords of the current site listed in the
+    ``EVENT_EXCLUDE_TAG_LIST`` setting, querying them only once per
+    process until ``clear_excluded_keyword_ids`` is called. Ids of
+    keywords that don't exist are left out.
+    """
+    tag_ids = tuple(settings.EVENT_EXCLUDE_TAG_LIST)
+    key = (current_site_id(), tag_ids)
+    excluded_keyword_ids = process_cache("excluded_keyword_ids")
+    try:
+        return excluded_keyword_ids[key]
+    except KeyError:
+        ids = Keyword.objects.filter(id__in=tag_ids).values_list("id", flat=True)
+        ids = frozenset(ids) if tag_ids else frozenset()
+        excluded_keyword_ids[key] = ids
+        return ids
+
+
+def clear_excluded_keyword_ids():
+    """
+    Forget the keywords resolved by ``get_excluded_keyword_ids`` in
+    every process.
+    """
+    invalidate_scope("excluded_keyword_ids")
+
+
+def _generation_key(site_id):
+    return "mezzanine_agenda.generation.%s" % site_id
+
+
+def _scope_key(scope):
+    return "mezzanine_agenda.generation.scope.%s" % scope
+
+
+def _generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def site_generation(site_id=None):
+    """
+    Return the current cache generation token for the given site.
+    """
+    if site_id is None:
+        site_id = current_site_id()
+    return _generation(_generation_key(site_id))
+
+
+def site_cache_key(name, parts=(), site_id=None, scopes=()):
+    """
+    Build a cache key for ``name`` that is scoped to the site and its
+    current generation, and to the generation of each of ``scopes``,
+    which are shared by every site. Extra ``parts`` are hashed so that
+    arbitrary values can be used without breaking memcached key
+    restrictions.
+    """
+    if site_id is None:
+        site_id = current_site_id()
+    key = "mezzanine_agenda.%s.%s.%s" % (name, site_id, site_generation(site_id))
+    for scope in scopes:
+        key = "%s.%s" % (key, _generation(_scope_key(scope)))
+    if parts:
+        digest = md5("|".join([str(part) for part in parts]).encode("utf-8"))
+        key = "%s.%s" % (key, digest.hexdigest())
+    return key
+
+
+def cached_for_site(name, func, parts=(), timeout=None, site_id=None, scopes=()):
+    """
+    Return the cached result of ``func`` for the site, calling it and
+    storing the result on a miss.
+    """
+    if timeout is None:
+        timeout = settings.EVENT_CACHE_TIMEOUT
+    key = site_cache_key(name, parts, site_id, scopes)
+    value = cache.get(key)
+    if value is None:
+        value = func()
+        cache.set(key, value, timeout)
+    return value
+
+
+def invalidate_site(site_id=None):
+    """
+    Drop every agenda value cached for the given site.
+    """
+    if site_id is None:
+        site_id = current_site_id()
+    cache.set(_generation_key(site_id), uuid4().hex, None)
+
+
+def invalidate_scope(scope):
+    """
+    Drop the agenda values of every site cached with ``scope``.
+    """
+    cache.set(_scope_key(scope), uuid4().hex, None)
+
+
+def process_cache(scope):
+    """
+    Return the dict holding the values of ``scope`` cached by this
+    process. It's emptied once ``invalidate_scope`` is called for the
+    scope in any process.
+    """
+    generation = _generation(_scope_key(scope))
+    cached = _process_caches.get(scope)
+    if cached is None or cached[0] != generation:
+        cached = _process_caches[scope] = (generation, {})
+    return cached[1]
+
+
+def cached_fragments(name, objects, get_key, build, chunk_size=100,
+                     timeout=None):
+    """
+    Yield ``build(obj)`` for each of the objects, reading and filling
+    the cache a chunk at a time with the keys ``get_key`` returns.
+    """
+    if timeout is None:
+        timeout = settings.EVENT_CACHE_TIMEOUT
+    chunk = []
+    for obj in objects:
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            for fragment in _cached_chunk(name, chunk, get_key, build, timeout):
+                yield fragment
+            chunk = []
+    for fragment in _cached_chunk(name, chunk, get_key, build, timeout):
+        yield fragment
+
+
+def _cached_chunk(name, objects, get_key, build, timeout):
+    if not objects:
+        return []
+    keys = [get_key(obj) for obj in objects]
+    cached = cache.get_many(keys)
+    missing = {}
+    fragments = []
+    for key, obj in zip(keys, objects):
+        if key not in cached:
+            missing[key] = cached[key] = build(obj)
+        fragments.append(cached[key])
+    if missing:
+        cache.set_many(missing, timeout)
+    record_cache_access(name, hits=len(keys) - len(missing), misses=len(missing))
+    return fragments
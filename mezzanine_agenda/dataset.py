@@ -0,0 +1,330 @@
+"""
+Synthetic agenda datasets for benchmarks and query budget tests.
+
+``generate_dataset`` bulk creates events with everything the views and
+tags read: parent and child events, multi-day events, keywords,
+locations with rooms, categories, prices and seasons. Rows are created
+with ``bulk_create``, so no signals are sent, and the occurrences
+``Event.save`` would normally build are created along the way.
+
+``dataset_urls`` and ``TAG_TEMPLATES`` cover every agenda URL and
+template tag, for the benchmarks to run against a generated dataset.
+"""
+from __future__ import unicode_literals
+
+import random
+from datetime import date, timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.urlresolvers import reverse
+from django.db.models import Max
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.utils import timezone
+
+from mezzanine.core.models import CONTENT_STATUS_DRAFT, CONTENT_STATUS_PUBLISHED
+from mezzanine.generic.models import AssignedKeyword, Keyword
+from mezzanine.utils.models import get_user_model
+from mezzanine.utils.sites import current_site_id
+
+from mezzanine_agenda.models import Event, EventCategory, EventLocation, \
+    EventOccurrence, EventPrice, Season, GEOCODE_DONE
+
+
+User = get_user_model()
+
+SLUG_PREFIX = "agenda-dataset-"
+
+
+def generate_dataset(events=1000, locations=20, rooms=3, categories=10,
+                     keywords=50, prices=20, seasons=5, children=3,
+                     seed=None, batch_size=5000):
+    """
+    Create ``events`` events spread over the last ``seasons`` seasons
+    and the next one, and return the number of rows created per model.
+
+    About one root event in five gets up to ``children`` child events
+    sharing its title, and one in ten spans several days. Each location
+    address has ``rooms`` rooms, which are separate locations. Slugs
+    start with ``SLUG_PREFIX`` and a number unique to the run, so that
+    datasets can be generated again in the same database.
+    """
+    rand = random.Random(seed)
+    run = (Event.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+    slug_prefix = "%s%d-" % (SLUG_PREFIX, run)
+    site = Site.objects.get(id=current_site_id())
+    user, _ = User.objects.get_or_create(username="agenda-dataset")
+    now = timezone.now()
+    counts = {}
+
+    locations = [EventLocation(
+        title="Dataset location %d" % i,
+        slug="%slocation-%d-%d" % (slug_prefix, i, room),
+        site=site,
+        address="%d Dataset Street" % i,
+        postal_code="%05d" % i,
+        city="Dataset City",
+        room="Room %d" % room if rooms > 1 else "",
+        lat=round(rand.uniform(-90, 90), 7),
+        lon=round(rand.uniform(-180, 180), 7),
+        geocode_status=GEOCODE_DONE,
+    ) for i in range(locations) for room in range(max(rooms, 1))]
+    locations = list(_bulk_create(EventLocation, locations).values_list("id", flat=True))
+    counts["locations"] = len(locations)
+
+    categories = list(_bulk_create(EventCategory, [
+        EventCategory(name="Dataset category %d" % i) for i in range(categories)
+    ]).values_list("id", flat=True))
+    counts["categories"] = len(categories)
+
+    prices = list(_bulk_create(EventPrice, [
+        EventPrice(value=5 * (i + 1), unit="EUR") for i in range(prices)
+    ]).values_list("id", flat=True))
+    counts["prices"] = len(prices)
+
+    keywords = list(_bulk_create(Keyword, [Keyword(
+        title="Dataset keyword %d" % i,
+        slug="%skeyword-%d" % (slug_prefix, i),
+        site=site,
+    ) for i in range(keywords)]).values_list("id", "title"))
+    counts["keywords"] = len(keywords)
+
+    # Seasons start on the 31st of July, as in ``ArchiveListView``.
+    first_year = now.year - seasons
+    for year in range(first_year, now.year + 1):
+        Season.objects.get_or_create(start__year=year, defaults={
+            "title": "Season %d-%d" % (year, year + 1),
+            "start": date(year, 7, 31),
+            "end": date(year + 1, 8, 1),
+        })
+    counts["seasons"] = Season.objects.filter(start__year__gte=first_year).count()
+
+    first_start = now.replace(year=first_year, month=7, day=31, hour=0,
+                              minute=0, second=0, microsecond=0)
+    span = (now - first_start).days + 365
+
+    def make_event(i, parent=None):
+        if parent is None:
+            start = first_start + timedelta(days=rand.randint(0, span),
+                                            hours=rand.randint(8, 22))
+            days = rand.randint(1, 14) if i % 10 == 0 else 0
+            end = start + timedelta(days=days, hours=rand.randint(1, 4))
+            status = CONTENT_STATUS_DRAFT if i % 50 == 49 else CONTENT_STATUS_PUBLISHED
+            location_id = rand.choice(locations) if locations else None
+            category_id = rand.choice(categories) if categories else None
+        else:
+            start = parent.start + timedelta(days=rand.randint(0, 30))
+            end = start + timedelta(hours=2)
+            status = parent.status
+            location_id = parent.location_id
+            category_id = parent.category_id
+        event_keywords = rand.sample(keywords, min(len(keywords), rand.randint(0, 3)))
+        event = Event(
+            title=parent.title if parent else "Dataset event %d" % i,
+            slug="%s%d" % (slug_prefix, i),
+            site=site,
+            user=user,
+            status=status,
+            publish_date=first_start,
+            start=start,
+            end=end,
+            location_id=location_id,
+            category_id=category_id,
+            keywords_string=" ".join(title for id, title in event_keywords),
+        )
+        event.dataset_parent = parent
+        event.dataset_keywords = [id for id, title in event_keywords]
+        event.dataset_prices = rand.sample(prices, min(len(prices), rand.randint(0, 2)))
+        return event
+
+    count = occurrences = 0
+    while count < events:
+        batch = []
+        while count < events and len(batch) < batch_size:
+            parent = make_event(count)
+            batch.append(parent)
+            count += 1
+            if count % 5 == 0:
+                for j in range(rand.randint(1, max(children, 1))):
+                    if count == events:
+                        break
+                    batch.append(make_event(count, parent))
+                    count += 1
+        occurrences += _create_events(batch)
+
+    counts["events"] = count
+    counts["occurrences"] = occurrences
+    return counts
+
+
+def _create_events(events):
+    """
+    Create a batch of generated events along with their occurrences,
+    prices and keywords, and return the number of occurrences.
+    Parents always come before their children in a batch.
+    """
+    parents = [event for event in events if event.dataset_parent is None]
+    _bulk_create_events(parents)
+    event_children = [event for event in events if event.dataset_parent is not None]
+    for event in event_children:
+        event.parent_id = event.dataset_parent.id
+    _bulk_create_events(event_children)
+
+    occurrences = EventOccurrence.build(events)
+    EventOccurrence.objects.bulk_create(occurrences)
+    Event.prices.through.objects.bulk_create([
+        Event.prices.through(event_id=event.id, eventprice_id=price_id)
+        for event in events for price_id in event.dataset_prices])
+    content_type = ContentType.objects.get_for_model(Event)
+    AssignedKeyword.objects.bulk_create([
+        AssignedKeyword(keyword_id=keyword_id, content_type=content_type,
+                        object_pk=event.id, _order=order)
+        for event in events
+        for order, keyword_id in enumerate(event.dataset_keywords)])
+    return len(occurrences)
+
+
+def _bulk_create(model, objects):
+    """
+    Bulk create objects and return the created rows in creation order,
+    leaving out those of datasets generated before, so that a seed
+    generates the same dataset again in a database that isn't empty.
+    """
+    last_id = model.objects.aggregate(Max("id"))["id__max"] or 0
+    model.objects.bulk_create(objects)
+    return model.objects.filter(id__gt=last_id).order_by("id")
+
+
+def _bulk_create_events(events):
+    """
+    Bulk create events and set their ids, which ``bulk_create``
+    doesn't return on every database.
+    """
+    ids = dict(_bulk_create(Event, events).values_list("slug", "id"))
+    for event in events:
+        event.id = ids[event.slug]
+
+
+# Templates some views render which the app doesn't ship.
+URL_TEMPLATES = {
+    "event_booking": "agenda/event_booking.html",
+    "location-list": "agenda/event_location_list.html",
+    "location-detail": "agenda/event_location_detail.html",
+}
+
+
+def _has_template(name):
+    try:
+        get_template(name)
+    except TemplateDoesNotExist:
+        return False
+    return True
+
+
+def dataset_urls():
+    """
+    Return a name and path for every agenda URL, pointing at the
+    generated events, locations, author and keywords. URLs of views
+    whose template the project doesn't provide are left out.
+    """
+    event = Event.objects.published().filter(slug__startswith=SLUG_PREFIX,
+        keywords__isnull=False, location__isnull=False).order_by("start").first()
+    keyword = event.keywords.select_related("keyword").first().keyword
+    today = date.today()
+    year, week = today.isocalendar()[:2]
+    urls = (
+        ("event_list", reverse("event_list")),
+        ("event_list_tag", reverse("event_list_tag", args=(keyword.slug,))),
+        ("event_list_location", reverse("event_list_location", args=(event.location.slug,))),
+        ("event_list_author", reverse("event_list_author", args=(event.user.username,))),
+        ("event_list_week", reverse("event_list_week", args=(year, week))),
+        ("event_list_year", reverse("event_list_year", args=(today.year,))),
+        ("event_list_month", reverse("event_list_month", args=(today.year, today.month))),
+        ("event_list_day", reverse("event_list_day", args=(today.year, today.month, today.day))),
+        ("event_detail", reverse("event_detail", args=(event.slug,))),
+        ("event_booking", reverse("event_booking", args=(event.slug,))),
+        ("icalendar", reverse("icalendar")),
+        ("icalendar_tag", reverse("icalendar_tag", args=(keyword.slug,))),
+        ("icalendar_location", reverse("icalendar_location", args=(event.location.slug,))),
+        ("icalendar_author", reverse("icalendar_author", args=(event.user.username,))),
+        ("icalendar_year", reverse("icalendar_year", args=(today.year,))),
+        ("icalendar_month", reverse("icalendar_month", args=(today.year, today.month))),
+        ("icalendar_event", reverse("icalendar_event", args=(event.slug,))),
+        ("event_feed rss", reverse("event_feed", args=("rss",))),
+        ("event_feed atom", reverse("event_feed", args=("atom",))),
+        ("event_feed_tag", reverse("event_feed_tag", args=(keyword.slug, "rss"))),
+        ("event_feed_location", reverse("event_feed_location", args=(event.location.slug, "rss"))),
+        ("event_feed_author", reverse("event_feed_author", args=(event.user.username, "rss"))),
+        ("location-list", reverse("location-list")),
+        ("location-detail", reverse("location-detail", args=(event.location.slug,))),
+        ("event-price-autocomplete", reverse("event-price-autocomplete")),
+    )
+    return tuple((name, path) for name, path in urls
+                 if name not in URL_TEMPLATES or _has_template(URL_TEMPLATES[name]))
+
+
+# Template snippets using every tag and filter of ``event_tags``, which
+# are rendered with ``dataset_tag_context``.
+TAG_TEMPLATES = (
+    ("event_months", "{% event_months as months %}"
+                     "{% for month in months %}{{ month.date }}{{ month.event_count }}{% endfor %}"),
+    ("event_locations", "{% event_locations as locations %}"
+                        "{% for location in locations %}{{ location }}{% endfor %}"),
+    ("event_authors", "{% event_authors as authors %}"
+                      "{% for author in authors %}{{ author }}{% endfor %}"),
+    ("recent_events", "{% recent_events 5 as events %}"
+                      "{% for event in events %}{{ event.title }}{% endfor %}"),
+    ("upcoming_events", "{% upcoming_events 5 as events %}"
+                        "{% for event in events %}{{ event.title }}{% endfor %}"),
+    ("google_calendar_url", "{% for event in events %}{{ event|google_calendar_url }}{% endfor %}"),
+    ("google_nav_url", "{% for event in events %}{{ event|google_nav_url }}{% endfor %}"),
+    ("google_static_map", "{% for event in events %}"
+                          "{% google_static_map event 300 200 10 %}{% endfor %}"),
+    ("icalendar_url", "{% icalendar_url %}"),
+    ("all_events", "{% all_events as events %}{{ events|length }}"),
+    ("all_days", "{% all_days as days %}{{ days|length }}"),
+    ("events_in_day", "{% for event in day|events_in_day %}{{ event.title }}{% endfor %}"),
+    ("month_event_days", "{% month_event_days year month as days %}"
+                         "{% for day in days %}{{ day.events|length }}{% endfor %}"),
+    ("week_event_days", "{% week_event_days year week as days %}"
+                        "{% for day in days %}{{ day.events|length }}{% endfor %}"),
+    ("season_event_days", "{% season_event_days year as days %}"
+                          "{% for day in days %}{{ day.events|length }}{% endfor %}"),
+    ("all_weeks", "{% all_weeks as weeks %}{{ weeks|length }}"),
+    ("event_calendar", "{% event_calendar year month as weeks %}{% for week in weeks %}"
+                       "{% for day in week %}{{ day.events|length }}{% endfor %}{% endfor %}"),
+    ("event_week_calendar", "{% event_week_calendar year week as days %}"
+                            "{% for day in days %}{{ day.events|length }}{% endfor %}"),
+    ("week_range", "{{ week|week_range:year }}"),
+    ("tag_is_excluded", "{% for keyword in keywords %}"
+                        "{{ keyword.keyword_id|tag_is_excluded }}{% endfor %}"),
+    ("get_tag", "{% for keyword in keywords %}{{ keyword.keyword_id|get_tag }}{% endfor %}"),
+    ("date_format", "{% for event in events %}{{ event.start|date:event.date_format }}"
+                    "{% endfor %}"),
+)
+
+
+def dataset_tag_context(limit=20, keywords=None):
+    """
+    Return the context ``TAG_TEMPLATES`` are rendered with: the first
+    ``limit`` upcoming published events, the keyword assignments of
+    events, all of them unless ``keywords`` caps them so that per
+    keyword lookups grow with the dataset, and the current year, month,
+    week and day.
+    """
+    today = date.today()
+    events = list(Event.objects.published().filter(start__gte=timezone.now(),
+        location__isnull=False).select_related("location", "user").order_by("start")[:limit])
+    assignments = AssignedKeyword.objects.filter(
+        content_type=ContentType.objects.get_for_model(Event)).order_by("id")
+    if keywords is not None:
+        assignments = assignments[:keywords]
+    return {
+        "events": events,
+        "keywords": list(assignments),
+        "year": today.year,
+        "month": today.month,
+        "week": today.isocalendar()[1],
+        "day": today,
+    }
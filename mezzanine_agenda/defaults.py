@@ -57,6 +57,15 @@ register_setting(
     default=5,
 )
 
+register_setting(
+    name="EVENT_LOCATIONS_PER_PAGE",
+    label=_("Locations per page"),
+    description=_("Number of locations shown on the location listing page. "
+        "Set to ``None`` to show all locations on one page."),
+    editable=False,
+    default=None,
+)
+
 register_setting(
     name="EVENT_RSS_LIMIT",
     label=_("Events RSS limit"),
@@ -94,6 +103,14 @@ register_setting(
     default=True,
 )
 
+register_setting(
+    name="EVENT_EXCLUDE_TAG_LIST",
+    description=_("Ids of the keywords whose events are left out of the "
+        "event listings, unless the listing is for that keyword."),
+    editable=False,
+    default=[],
+)
+
 register_setting(
     name="PAST_EVENTS",
     label=_("Past events"),
@@ -101,3 +118,106 @@ register_setting(
     editable=True,
     default=False,
 )
+
+register_setting(
+    name="EVENT_PAST_EVENTS_LIMIT",
+    description=_("Maximum number of past events shown when ``PAST_EVENTS`` "
+        "is enabled."),
+    editable=False,
+    default=10,
+)
+
+register_setting(
+    name="EVENT_PAST_EVENTS_CACHE_TIMEOUT",
+    description=_("Number of seconds past events are cached for."),
+    editable=False,
+    default=300,
+)
+
+register_setting(
+    name="EVENT_CACHE_TIMEOUT",
+    label=_("Events cache timeout"),
+    description=_("Number of seconds aggregated event data (such as the "
+        "archive months) is cached for. Cached values are also dropped "
+        "whenever an event is saved or deleted."),
+    editable=False,
+    default=3600,
+)
+
+register_setting(
+    name="EVENT_ICALENDAR_STREAMING",
+    label=_("Stream iCalendar files"),
+    description=_("If ``True``, calendar.ics files are streamed one event "
+        "at a time instead of being built in memory before being sent."),
+    editable=False,
+    default=False,
+)
+
+register_setting(
+    name="EVENT_GEOCODER",
+    description=_("Dotted path to the geocoder backend used to find the "
+        "latitude and longitude of event locations."),
+    editable=False,
+    default="mezzanine_agenda.geocoding.GoogleGeocoder",
+)
+
+register_setting(
+    name="EVENT_GEOCODE_ASYNC",
+    description=_("If ``True``, event locations are saved without waiting "
+        "for the geocoder and are geocoded later by the "
+        "``geocode_locations`` command or the in-process workers."),
+    editable=False,
+    default=False,
+)
+
+register_setting(
+    name="EVENT_GEOCODE_WORKERS",
+    description=_("Number of in-process threads geocoding event locations "
+        "once they're saved. Set to ``0`` to only geocode them with the "
+        "``geocode_locations`` command."),
+    editable=False,
+    default=0,
+)
+
+register_setting(
+    name="EVENT_LOCAL_GEOCODES",
+    description=_("Mapping of addresses to ``(latitude, longitude)`` pairs "
+        "used by the ``mezzanine_agenda.geocoding.LocalGeocoder`` backend."),
+    editable=False,
+    default={},
+)
+
+register_setting(
+    name="EVENT_GEOCODE_NEGATIVE_TTL",
+    description=_("Number of seconds an address the geocoder couldn't find "
+        "is remembered for before it is geocoded again."),
+    editable=False,
+    default=86400,
+)
+
+register_setting(
+    name="EVENT_INSTRUMENTATION",
+    description=_("If ``True``, the ``AgendaInstrumentationMiddleware`` "
+        "records the query count, database time, render time and size of "
+        "agenda responses, and adds a ``Server-Timing`` header to them."),
+    editable=False,
+    default=False,
+)
+
+register_setting(
+    name="EVENT_INSTRUMENTATION_FLUSH_INTERVAL",
+    description=_("Number of seconds between copies of the agenda request "
+        "statistics of a process to the cache, where the ``agenda_stats`` "
+        "command reads them."),
+    editable=False,
+    default=60,
+)
+
+register_setting(
+    name="EVENT_PAGINATION",
+    description=_("How event listings are paginated: ``\"pages\"`` for page "
+        "numbers, or ``\"keyset\"`` for cursors on the start date of events, "
+        "which cost the same on every page and skip counting events."),
+    editable=False,
+    default="pages",
+)
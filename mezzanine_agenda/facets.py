@@ -0,0 +1,70 @@
+"""
+Facet counts of event listings: the number of events per category,
+location title and keyword, read with one grouped query per facet.
+"""
+from __future__ import unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count
+from django.utils.translation import get_language
+
+from mezzanine.generic.models import AssignedKeyword
+
+from mezzanine_agenda.cache import cached_for_site
+from mezzanine_agenda.models import Event, EventCategory, EventLocation
+
+
+FILTER_PARAMS = ("event_categories_filter", "event_locations_filter")
+
+
+def _filtered(events, filters, facet):
+    """
+    Apply the filters of every facet but ``facet`` to the events.
+    """
+    for name, condition in filters.items():
+        if name != facet:
+            events = events.filter(condition)
+    return events.order_by().values("id")
+
+
+def event_facets(events, filters=None):
+    """
+    Return the number of the given events per category name, per
+    location title, and per keyword as dicts with the keyword's title,
+    slug and event count, ordered by title.
+
+    ``filters`` maps facet names to the conditions selected on them.
+    Each facet is counted with the conditions of the other facets only,
+    so that selecting a choice doesn't hide the others.
+    """
+    filters = filters or {}
+    categories = EventCategory.objects.filter(
+        events__in=_filtered(events, filters, "categories"))
+    categories = categories.annotate(event_count=Count("events"))
+    locations = EventLocation.objects.filter(
+        event__in=_filtered(events, filters, "locations")).order_by()
+    locations = locations.values("title").annotate(event_count=Count("event"))
+    keywords = AssignedKeyword.objects.filter(
+        content_type=ContentType.objects.get_for_model(Event),
+        object_pk__in=_filtered(events, filters, "keywords")).order_by()
+    keywords = keywords.values("keyword__title", "keyword__slug")
+    keywords = keywords.annotate(event_count=Count("id")).order_by("keyword__title")
+    return {
+        "categories": dict((category.name, category.event_count) for category in categories),
+        "locations": dict((location["title"], location["event_count"])
+                          for location in locations),
+        "keywords": [{"title": keyword["keyword__title"], "slug": keyword["keyword__slug"],
+                      "event_count": keyword["event_count"]} for keyword in keywords],
+    }
+
+
+def cached_event_facets(request, events, filters=None):
+    """
+    Return the facets of the events listed for a request, cached per
+    site, language, URL and filter combination until an event changes.
+    """
+    parts = [request.path, request.user.is_staff, get_language()]
+    for param in FILTER_PARAMS:
+        parts.append(sorted(request.GET.getlist(param)))
+    return cached_for_site("event_facets", lambda: event_facets(events, filters), parts=parts,
+                           scopes=("categories",))
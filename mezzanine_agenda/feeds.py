@@ -17,6 +17,24 @@ from mezzanine.utils.models import get_user_model
 User = get_user_model()
 
 
+def feed_events(tag=None, location=None, username=None):
+    """
+    Returns the published events of a feed, filtered by tag slug,
+    location slug or author's username.
+    """
+    events = Event.objects.published().select_related("user", "location")
+    if tag:
+        tag = get_object_or_404(Keyword, slug=tag)
+        events = events.filter(keywords__keyword=tag)
+    if location:
+        location = get_object_or_404(EventLocation, slug=location)
+        events = events.filter(location=location)
+    if username:
+        author = get_object_or_404(User, username=username)
+        events = events.filter(user=author)
+    return events
+
+
 class EventsRSS(Feed):
     """
     RSS feed for all events.
@@ -61,16 +79,8 @@ class EventsRSS(Feed):
     def items(self):
         if not self._public:
             return []
-        events = Event.objects.published().select_related("user")
-        if self.tag:
-            tag = get_object_or_404(Keyword, slug=self.tag)
-            events = events.filter(keywords__keyword=tag)
-        if self.location:
-            location = get_object_or_404(EventLocation, slug=self.location)
-            events = events.filter(location=location)
-        if self.username:
-            author = get_object_or_404(User, username=self.username)
-            events = events.filter(user=author)
+        events = feed_events(tag=self.tag, location=self.location,
+                             username=self.username)
         limit = settings.EVENT_RSS_LIMIT
         if limit is not None:
             events = events[:settings.EVENT_RSS_LIMIT]
@@ -1,16 +1,54 @@
 from django import forms
+from django.utils.translation import get_language
+from mezzanine_agenda.cache import cached_for_site
 from mezzanine_agenda.models import *
 from dal import autocomplete
 
 
+def _filter_choices():
+    event_categories = [(cat.name, cat.name) for cat in EventCategory.objects.all()]
+    # Locations have one row per room, their titles are listed once.
+    titles = EventLocation.objects.order_by('title').values_list('title', flat=True).distinct()
+    event_locations = [(title, title) for title in titles]
+    return {'categories': event_categories, 'locations': event_locations}
+
+
+def get_filter_choices():
+    """
+    Return the category and location choices of ``EventFilterForm``,
+    cached per site and language until a category or location changes.
+    """
+    return cached_for_site('event_filter_choices', _filter_choices, parts=(get_language(),),
+                           scopes=('categories',))
+
+
+def _facet_choices(choices, counts, selected):
+    """
+    Add event counts to the labels of choices, leaving out those
+    without events unless they're selected.
+    """
+    return [(value, '%s (%s)' % (label, counts.get(value, 0))) for value, label in choices
+            if counts.get(value) or value in selected]
+
+
 class EventFilterForm(forms.Form):
+    """
+    Filters of event listings. Given the ``facets`` of the listed
+    events, choices show their number of events and those without any
+    are left out.
+    """
 
     def __init__(self, *args, **kwargs):
+        facets = kwargs.pop('facets', None)
         super(EventFilterForm, self).__init__(*args, **kwargs)
-        event_categories = EventCategory.objects.all()
-        event_categories = [(cat.name, cat.name) for cat in event_categories]
-        event_locations = EventLocation.objects.distinct('title')
-        event_locations = [(loc.title, loc.title) for loc in event_locations]
+        choices = get_filter_choices()
+        event_categories = choices['categories']
+        event_locations = choices['locations']
+        if facets is not None:
+            event_categories = _facet_choices(event_categories, facets['categories'],
+                                              self.initial.get('event_categories_filter', []))
+            event_locations = _facet_choices(event_locations, facets['locations'],
+                                             self.initial.get('event_locations_filter', []))
         self.fields['event_categories_filter'] = forms.MultipleChoiceField(
             required=False,
             widget=forms.CheckboxSelectMultiple,
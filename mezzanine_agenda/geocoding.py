@@ -0,0 +1,102 @@
+"""
+Geocoder backends for event locations. The backend in use is set with
+the ``EVENT_GEOCODER`` setting, and is any class with a ``name`` and a
+``geocode`` method returning an ``(address, (lat, lon))`` pair, or
+``None`` if the address can't be found.
+"""
+from __future__ import unicode_literals
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.utils.module_loading import import_string
+
+from geopy.geocoders import GoogleV3 as GoogleMaps
+from geopy.exc import GeocoderQueryError, GeopyError
+
+from mezzanine.conf import settings
+
+
+class GeocodeError(Exception):
+    """
+    Raised by geocoder backends when an address can't be geocoded.
+    """
+
+
+class GeocodeUnavailable(Exception):
+    """
+    Raised when the geocoder fails or can't be reached, eg. on a
+    timeout, rather than not finding an address. Geocoding should be
+    tried again later.
+    """
+
+
+class GoogleGeocoder(object):
+    """
+    Geocodes addresses with the Google Maps API.
+    """
+
+    name = "Google Maps"
+
+    def __init__(self):
+        self.geocoder = GoogleMaps(api_key=settings.GOOGLE_API_KEY,
+                                   domain=settings.EVENT_GOOGLE_MAPS_DOMAIN)
+
+    def geocode(self, address):
+        try:
+            location = self.geocoder.geocode(address)
+        except GeocoderQueryError as e:
+            raise GeocodeError(e)
+        except ValueError as e:
+            raise GeocodeError(e)
+        except GeopyError as e:
+            raise GeocodeUnavailable(e)
+        if location is None:
+            return None
+        return location.address, (location.latitude, location.longitude)
+
+
+class LocalGeocoder(object):
+    """
+    Geocodes addresses from the ``EVENT_LOCAL_GEOCODES`` setting without
+    any network access, for tests and offline environments.
+    """
+
+    name = "local geocodes"
+
+    def geocode(self, address):
+        try:
+            lat, lon = settings.EVENT_LOCAL_GEOCODES[address]
+        except KeyError:
+            return None
+        return address, (lat, lon)
+
+
+def normalize_address(address):
+    """
+    Normalize an address for geocoder result lookups, ignoring case,
+    whitespace and spacing around commas.
+    """
+    address = re.sub(r"\s*,\s*", ", ", address.strip().lower())
+    return " ".join(address.split()).strip(", ")
+
+
+def get_geocoder():
+    """
+    Return an instance of the ``EVENT_GEOCODER`` backend.
+    """
+    return import_string(settings.EVENT_GEOCODER)()
+
+
+_executor = None
+
+
+def submit(func, *args):
+    """
+    Run ``func`` in the in-process geocoding thread pool, which is
+    sized with the ``EVENT_GEOCODE_WORKERS`` setting.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.EVENT_GEOCODE_WORKERS)
+    return _executor.submit(func, *args)
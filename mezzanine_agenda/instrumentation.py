@@ -0,0 +1,237 @@
+"""
+Request statistics of the agenda views.
+
+``AgendaInstrumentationMiddleware`` records the query count, database
+time, template render time and response size of every request served
+by ``mezzanine_agenda.views``, and sends them back in a
+``Server-Timing`` header. Statistics are aggregated per view in a
+process registry, which is regularly copied to the cache so that the
+``agenda_stats`` command can add up the statistics of every process.
+"""
+from __future__ import unicode_literals
+
+import os
+import socket
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorWrapper
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    MiddlewareMixin = object
+
+from mezzanine.conf import settings
+
+
+STATS_FIELDS = ("requests", "queries", "max_queries", "db_ms", "render_ms", "bytes")
+STATS_KEYS_KEY = "mezzanine_agenda.stats"
+STATS_TIMEOUT = 86400
+
+_stats = {}
+_stats_lock = threading.Lock()
+_stats_key = "%s.%s.%s" % (STATS_KEYS_KEY, socket.gethostname(), os.getpid())
+_flushed = [time.time()]
+
+
+def record_request(view, queries, db_ms, render_ms, size):
+    """
+    Add a request served by ``view`` to the process statistics, and
+    copy them to the cache every ``EVENT_INSTRUMENTATION_FLUSH_INTERVAL``
+    seconds.
+    """
+    with _stats_lock:
+        stats = _stats.setdefault(view, dict.fromkeys(STATS_FIELDS, 0))
+        stats["requests"] += 1
+        stats["queries"] += queries
+        stats["max_queries"] = max(stats["max_queries"], queries)
+        stats["db_ms"] += db_ms
+        stats["render_ms"] += render_ms
+        stats["bytes"] += size
+    if time.time() - _flushed[0] >= settings.EVENT_INSTRUMENTATION_FLUSH_INTERVAL:
+        flush_stats()
+
+
+def flush_stats():
+    """
+    Copy the process statistics to the cache.
+    """
+    with _stats_lock:
+        _flushed[0] = time.time()
+        snapshot = dict((view, dict(stats)) for view, stats in _stats.items())
+    cache.set(_stats_key, snapshot, STATS_TIMEOUT)
+    keys = cache.get(STATS_KEYS_KEY) or []
+    if _stats_key not in keys:
+        cache.set(STATS_KEYS_KEY, keys + [_stats_key], STATS_TIMEOUT)
+
+
+def get_stats():
+    """
+    Return the statistics of every process per view, with the average
+    query count, database time, render time and size of a request.
+    """
+    flush_stats()
+    keys = cache.get(STATS_KEYS_KEY) or []
+    totals = {}
+    for snapshot in cache.get_many(keys).values():
+        for view, stats in snapshot.items():
+            total = totals.setdefault(view, dict.fromkeys(STATS_FIELDS, 0))
+            for field in STATS_FIELDS:
+                if field == "max_queries":
+                    total[field] = max(total[field], stats[field])
+                else:
+                    total[field] += stats[field]
+    for total in totals.values():
+        for field in ("queries", "db_ms", "render_ms", "bytes"):
+            total["avg_%s" % field] = float(total[field]) / total["requests"]
+    return totals
+
+
+def reset_stats():
+    """
+    Clear the statistics of this process and those copied to the cache.
+    """
+    with _stats_lock:
+        _stats.clear()
+    cache.delete_many(cache.get(STATS_KEYS_KEY) or [])
+    cache.delete(STATS_KEYS_KEY)
+
+
+class _TimedCursor(CursorWrapper):
+
+    def __init__(self, cursor, db, timer):
+        super(_TimedCursor, self).__init__(cursor, db)
+        self.timer = timer
+
+    def execute(self, sql, params=None):
+        started = time.time()
+        try:
+            return super(_TimedCursor, self).execute(sql, params)
+        finally:
+            self.timer.add(time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return super(_TimedCursor, self).executemany(sql, param_list)
+        finally:
+            self.timer.add(time.time() - started)
+
+
+class QueryTimer(object):
+    """
+    Count the queries run on a database connection and add up their
+    time between ``start`` and ``stop``. Unlike ``CaptureQueriesContext``
+    it doesn't turn the debug cursor on, so queries aren't kept in
+    memory and nothing is left behind on the connection once stopped.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.count = 0
+        self.ms = 0.0
+        self._cursor = None
+
+    def add(self, seconds):
+        self.count += 1
+        self.ms += seconds * 1000
+
+    def start(self):
+        self._cursor = self.connection.__dict__.get("cursor")
+        cursor = self.connection.cursor
+        self.connection.cursor = lambda: _TimedCursor(cursor(), self.connection, self)
+
+    def stop(self):
+        if self._cursor is not None:
+            self.connection.cursor = self._cursor
+        else:
+            self.connection.__dict__.pop("cursor", None)
+
+
+def _view_name(view_func):
+    view = getattr(view_func, "view_class", view_func)
+    if view.__module__ != "mezzanine_agenda.views":
+        return None
+    return view.__name__
+
+
+class AgendaInstrumentationMiddleware(MiddlewareMixin):
+    """
+    Record statistics of the requests served by the agenda views when
+    ``EVENT_INSTRUMENTATION`` is enabled. Other requests, and every
+    request while it's disabled, go through untouched.
+
+    Queries are counted until the response is returned. The size of
+    streaming responses isn't known by then, they are recorded once
+    their content has been consumed, but the queries run while their
+    content is generated aren't counted.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.EVENT_INSTRUMENTATION:
+            return
+        view = _view_name(view_func)
+        if view is None:
+            return
+        queries = QueryTimer()
+        request._agenda_instrumentation = {
+            "view": view,
+            "started": time.time(),
+            "queries": queries,
+            "render_ms": 0,
+        }
+        queries.start()
+
+    def process_template_response(self, request, response):
+        instrumentation = getattr(request, "_agenda_instrumentation", None)
+        if instrumentation is not None:
+            render_started = time.time()
+
+            def rendered(response):
+                instrumentation["render_ms"] = (time.time() - render_started) * 1000
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def process_response(self, request, response):
+        instrumentation = getattr(request, "_agenda_instrumentation", None)
+        if instrumentation is None:
+            return response
+        del request._agenda_instrumentation
+        queries = instrumentation["queries"]
+        try:
+            return self.record_response(response, instrumentation, queries.count,
+                                        queries.ms)
+        finally:
+            queries.stop()
+
+    def process_exception(self, request, exception):
+        instrumentation = getattr(request, "_agenda_instrumentation", None)
+        if instrumentation is not None:
+            del request._agenda_instrumentation
+            instrumentation["queries"].stop()
+
+    def record_response(self, response, instrumentation, query_count, db_ms):
+        render_ms = instrumentation["render_ms"]
+        total_ms = (time.time() - instrumentation["started"]) * 1000
+        response["Server-Timing"] = (
+            'db;dur=%.1f;desc="%d queries", render;dur=%.1f, total;dur=%.1f'
+            % (db_ms, query_count, render_ms, total_ms))
+        record = lambda size: record_request(instrumentation["view"], query_count,
+                                             db_ms, render_ms, size)
+        if response.streaming:
+            response.streaming_content = self.count_streamed(
+                response.streaming_content, record)
+        else:
+            record(len(response.content))
+        return response
+
+    def count_streamed(self, content, record):
+        size = 0
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+        record(size)
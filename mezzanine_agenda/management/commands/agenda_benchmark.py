@@ -0,0 +1,251 @@
+from __future__ import unicode_literals
+
+import json
+import time
+from fnmatch import fnmatch
+import tracemalloc
+from calendar import monthrange
+from datetime import date, datetime
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.template import Context, Template
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, \
+    teardown_test_environment
+from django.utils import timezone
+
+from mezzanine_agenda import __version__
+from mezzanine_agenda.cache import invalidate_site
+from mezzanine_agenda.dataset import TAG_TEMPLATES, dataset_tag_context, dataset_urls, \
+    generate_dataset
+from mezzanine_agenda.models import Event
+from mezzanine_agenda.templatetags.event_tags import _event_months
+from mezzanine_agenda.utils import get_event_timezone
+from mezzanine_agenda.windows import month_window, overlapping, year_window
+
+
+def legacy_event_months():
+    """
+    The Python side month counting ``event_months`` used to do, kept
+    so that its cost can be compared with the database aggregation.
+    """
+    app_timezone = get_event_timezone()
+    dates = Event.objects.published().values_list("start", flat=True)
+    correct_timezone_dates = [timezone.make_naive(date, app_timezone) for date in dates]
+    date_dicts = [{"date": datetime(date.year, date.month, 1)} for date in correct_timezone_dates]
+    month_dicts = []
+    for date_dict in date_dicts:
+        if date_dict not in month_dicts:
+            month_dicts.append(date_dict)
+    for i, date_dict in enumerate(month_dicts):
+        month_dicts[i]["event_count"] = date_dicts.count(date_dict)
+    return month_dicts
+
+
+def legacy_month_calendar():
+    """
+    The ``all_days`` and ``events_in_day`` pattern month calendars used
+    to be rendered with: one query per day of the month.
+    """
+    today = date.today()
+    days = []
+    for day in range(1, monthrange(today.year, today.month)[1] + 1):
+        day = date(today.year, today.month, day)
+        days.append((day, list(Event.objects.filter(start__date=day))))
+    return days
+
+
+def legacy_all_weeks():
+    events = Event.objects.all()
+    first_event = events[0]
+    last_event = events[len(events)-1]
+    return range(first_event.start.isocalendar()[1], last_event.start.isocalendar()[1]+1)
+
+
+def legacy_archive_month():
+    """
+    The month filter archives used to apply, which ORs ranges and
+    ``start__month``/``end__month`` lookups the database can't index.
+    """
+    today = date.today()
+    first_day = date(today.year, today.month, 1)
+    last_day = date(today.year, today.month, monthrange(today.year, today.month)[1])
+    events = Event.objects.published().filter(
+        (Q(start__lt=first_day) & Q(end__gt=last_day))
+        | Q(start__range=(first_day, last_day))
+        | Q(end__month=today.month) | Q(start__month=today.month))
+    return list(events.order_by("start"))
+
+
+def archive_month():
+    today = date.today()
+    events = overlapping(Event.objects.published(), month_window(today.year, today.month))
+    return list(events.order_by("start"))
+
+
+def legacy_year_events():
+    return list(Event.objects.published().filter(start__year=date.today().year))
+
+
+def year_events():
+    return list(overlapping(Event.objects.published(), year_window(date.today().year)))
+
+
+def month_calendar():
+    today = date.today()
+    return render_calendar("event_calendar %d %d" % (today.year, today.month))
+
+
+def render_calendar(tag):
+    template = Template("{%% load event_tags %%}{%% %s as value %%}"
+                        "{%% for week in value %%}{%% for day in week %%}"
+                        "{{ day.date }}{%% for event in day.events %%}{{ event.title }}"
+                        "{%% endfor %%}{%% endfor %%}{%% endfor %%}" % tag)
+    return template.render(Context())
+
+
+LEGACY_BENCHMARKS = (
+    ("event_months (legacy)", legacy_event_months),
+    ("event_months", _event_months),
+    ("month calendar (legacy)", legacy_month_calendar),
+    ("event_calendar", month_calendar),
+    ("all_weeks (legacy)", legacy_all_weeks),
+    ("all_weeks", lambda: Template("{% load event_tags %}{% all_weeks as weeks %}"
+                                   "{{ weeks|length }}").render(Context())),
+    ("archive month (legacy)", legacy_archive_month),
+    ("archive month", archive_month),
+    ("year events (legacy)", legacy_year_events),
+    ("year events", year_events),
+)
+
+
+class Command(BaseCommand):
+    """
+    Time every agenda URL and template tag against generated datasets,
+    along with the legacy implementations of rewritten hot paths, and
+    report the wall time, query count and peak memory of each as JSON.
+    Every dataset is created inside a transaction which is rolled back
+    afterwards, so the command leaves the database untouched.
+    """
+
+    help = "Benchmark agenda views and tags against generated datasets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10000,100000,1000000",
+            help="Comma separated numbers of events to benchmark with.")
+        parser.add_argument("--repeat", type=int, default=3,
+            help="Number of timed runs per benchmark, the best is kept.")
+        parser.add_argument("--skip-legacy", action="store_true",
+            help="Don't run the legacy implementations.")
+        parser.add_argument("--only", default="*",
+            help="Comma separated shell patterns of the benchmark names to run, "
+                 "eg. 'event_list*,icalendar'.")
+        parser.add_argument("--exclude", default="",
+            help="Comma separated shell patterns of the benchmark names to skip.")
+        parser.add_argument("--seed", type=int, default=0,
+            help="Random seed of the generated datasets.")
+        parser.add_argument("--output", default=None,
+            help="File the JSON report is written to, instead of stdout.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        results = []
+        setup_test_environment()
+        try:
+            for size in sizes:
+                with transaction.atomic():
+                    generate_dataset(events=size, seed=options["seed"])
+                    for kind, name, func in self.benchmarks(options["skip_legacy"]):
+                        if not self.selected(name, options["only"], options["exclude"]):
+                            continue
+                        try:
+                            # A failing benchmark is rolled back on its own.
+                            with transaction.atomic():
+                                result = self.measure(func, options["repeat"])
+                        except Exception as error:
+                            result = {"error": "%s: %s" % (type(error).__name__, error)}
+                            self.stderr.write("%9d events  %-28s failed: %s" % (
+                                size, name, result["error"]))
+                        else:
+                            self.stderr.write("%9d events  %-28s %10.2f ms %5d queries %8d KiB" % (
+                                size, name, result["wall_ms"], result["queries"],
+                                result["peak_memory_kib"]))
+                        result.update({"size": size, "kind": kind, "name": name})
+                        results.append(result)
+                    transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+        report = json.dumps({
+            "version": __version__,
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "results": results,
+        }, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report)
+        else:
+            self.stdout.write(report)
+
+    def selected(self, name, only, exclude):
+        """
+        Return whether the benchmark ``name`` matches a pattern of
+        ``only`` and none of ``exclude``.
+        """
+        matches = lambda patterns: any(fnmatch(name, pattern.strip())
+                                       for pattern in patterns.split(",") if pattern.strip())
+        return matches(only) and not matches(exclude)
+
+    def benchmarks(self, skip_legacy=False):
+        """
+        Yield the kind, name and function of every benchmark.
+        """
+        client = Client()
+        client.force_login(Event.objects.filter(slug__startswith="agenda-dataset-")[0].user)
+        for name, path in dataset_urls():
+            yield "url", name, lambda path=path: self.get(client, path)
+        # Keyword lookups are timed on a fixed number of keywords.
+        context = dataset_tag_context(keywords=1000)
+        for name, source in TAG_TEMPLATES:
+            template = Template("{% load event_tags %}" + source)
+            yield "tag", name, lambda template=template: template.render(Context(context))
+        for name, func in LEGACY_BENCHMARKS:
+            if not (skip_legacy and "(legacy)" in name):
+                yield "comparison", name, func
+
+    def get(self, client, path):
+        response = client.get(path)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        if response.status_code not in (200, 302):
+            raise AssertionError("%s returned %s" % (path, response.status_code))
+        return response
+
+    def measure(self, func, repeat):
+        """
+        Run ``func`` once with the queries and memory allocations
+        recorded, then ``repeat`` more times to keep the best wall time.
+        Cached agenda data is invalidated before every run.
+        """
+        invalidate_site()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as context:
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        best = None
+        for i in range(max(repeat, 1)):
+            invalidate_site()
+            started = time.time()
+            func()
+            elapsed = time.time() - started
+            if best is None or elapsed < best:
+                best = elapsed
+        return {
+            "wall_ms": round(best * 1000, 2),
+            "queries": len(context.captured_queries),
+            "peak_memory_kib": peak // 1024,
+        }
@@ -0,0 +1,43 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mezzanine_agenda.dataset import generate_dataset
+
+
+class Command(BaseCommand):
+    """
+    Fill the database with a synthetic agenda, to try the site or
+    profile it at a realistic scale. Meant for development databases.
+    """
+
+    help = "Generate a synthetic agenda dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=1000,
+            help="Number of events, children included.")
+        parser.add_argument("--locations", type=int, default=20,
+            help="Number of location addresses.")
+        parser.add_argument("--rooms", type=int, default=3,
+            help="Number of rooms per location address.")
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--keywords", type=int, default=50)
+        parser.add_argument("--prices", type=int, default=20)
+        parser.add_argument("--seasons", type=int, default=5,
+            help="Number of past seasons the events are spread over.")
+        parser.add_argument("--children", type=int, default=3,
+            help="Maximum number of children of parent events.")
+        parser.add_argument("--seed", type=int, default=None,
+            help="Random seed, to generate the same dataset again.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = generate_dataset(
+                events=options["events"], locations=options["locations"],
+                rooms=options["rooms"], categories=options["categories"],
+                keywords=options["keywords"], prices=options["prices"],
+                seasons=options["seasons"], children=options["children"],
+                seed=options["seed"])
+        for name, count in sorted(counts.items()):
+            self.stdout.write("%9d %s" % (count, name))
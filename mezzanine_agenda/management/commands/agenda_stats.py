@@ -0,0 +1,37 @@
+from __future__ import unicode_literals
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from mezzanine_agenda.instrumentation import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    """
+    Print the request statistics ``AgendaInstrumentationMiddleware``
+    recorded for each agenda view, added up over every process.
+    """
+
+    help = "Dump the agenda request statistics."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true",
+            help="Print the statistics as JSON.")
+        parser.add_argument("--reset", action="store_true",
+            help="Clear the statistics once they're printed.")
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2, sort_keys=True))
+        else:
+            self.stdout.write("%-36s %8s %8s %6s %10s %10s %10s" % (
+                "view", "requests", "queries", "max", "db ms", "render ms", "bytes"))
+            for view, view_stats in sorted(stats.items()):
+                self.stdout.write("%-36s %8d %8.1f %6d %10.1f %10.1f %10d" % (
+                    view, view_stats["requests"], view_stats["avg_queries"],
+                    view_stats["max_queries"], view_stats["avg_db_ms"],
+                    view_stats["avg_render_ms"], view_stats["avg_bytes"]))
+        if options["reset"]:
+            reset_stats()
@@ -0,0 +1,36 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from mezzanine_agenda.cache import get_cache_stats
+from mezzanine_agenda.models import EventLocation, GEOCODE_FAILED, \
+    GEOCODE_PENDING, geocode_pending_locations
+
+
+class Command(BaseCommand):
+    """
+    Geocode the event locations saved while ``EVENT_GEOCODE_ASYNC`` is
+    enabled. Meant to be run periodically, eg. from cron.
+    """
+
+    help = "Geocode event locations waiting for it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None,
+            help="Maximum number of locations to geocode.")
+        parser.add_argument("--retry-failed", action="store_true",
+            help="Also retry the locations which previously failed.")
+
+    def handle(self, *args, **options):
+        statuses = [GEOCODE_PENDING]
+        if options["retry_failed"]:
+            statuses.append(GEOCODE_FAILED)
+        locations = EventLocation.objects.filter(geocode_status__in=statuses)
+        if options["limit"]:
+            locations = locations[:options["limit"]]
+        geocoded, failed = geocode_pending_locations(locations)
+        self.stdout.write("%d locations geocoded, %d failed." % (geocoded, failed))
+        stats = get_cache_stats()
+        self.stdout.write("%d geocoder calls, %d cached results (%.0f%% hit rate)." % (
+            stats.get("geocode_misses", 0), stats.get("geocode_hits", 0),
+            stats.get("geocode_hit_rate", 0) * 100))
@@ -0,0 +1,33 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mezzanine_agenda.models import Event
+
+
+class Command(BaseCommand):
+    """
+    Push the inherited fields and relations of parent events down their
+    whole tree of children, eg. after importing events with bulk tools
+    that skip ``Event.save``.
+    """
+
+    help = "Re-sync child events with their parents."
+
+    def add_arguments(self, parser):
+        parser.add_argument("event_ids", nargs="*", type=int,
+            help="Ids of the events whose trees are synced. Defaults to "
+                 "every event without a parent.")
+
+    def handle(self, *args, **options):
+        if options["event_ids"]:
+            events = Event.objects.filter(id__in=options["event_ids"])
+        else:
+            events = Event.objects.filter(parent__isnull=True, children__isnull=False)
+        synced = 0
+        for event in events.distinct():
+            with transaction.atomic():
+                event.update_children()
+            synced += 1
+        self.stdout.write("%d event trees synced." % synced)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mezzanine_agenda', '0028_auto_20180926_1235'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventlocation',
+            name='geocode_status',
+            field=models.CharField(blank=True, choices=[('pending', 'pending'), ('done', 'done'), ('failed', 'failed')], editable=False, max_length=16, verbose_name='geocode status'),
+        ),
+    ]
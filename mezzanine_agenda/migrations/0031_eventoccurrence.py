@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import time, timedelta
+
+import pytz
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def event_days(start, end, app_timezone):
+    """
+    Return the days an event covers, as ``mezzanine_agenda.utils``
+    computed them when this migration was written. An event ending at
+    midnight doesn't cover the day it ends on.
+    """
+    first = timezone.localtime(start, app_timezone) if timezone.is_aware(start) else start
+    last = first
+    if end and end > start:
+        last = timezone.localtime(end, app_timezone) if timezone.is_aware(end) else end
+    last_day = last.date()
+    if last.time() == time(0) and last_day > first.date():
+        last_day -= timedelta(days=1)
+    days = []
+    day = first.date()
+    while day <= last_day:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def build_occurrences(apps, schema_editor):
+    Event = apps.get_model('mezzanine_agenda', 'Event')
+    EventOccurrence = apps.get_model('mezzanine_agenda', 'EventOccurrence')
+    # The time zone comes from the settings module, editable settings
+    # aren't read in migrations.
+    event_time_zone = getattr(settings, 'EVENT_TIME_ZONE', '')
+    if event_time_zone:
+        app_timezone = pytz.timezone(event_time_zone)
+    else:
+        app_timezone = timezone.get_default_timezone()
+    occurrences = []
+    for event in Event.objects.only('id', 'start', 'end').iterator():
+        for day in event_days(event.start, event.end, app_timezone):
+            occurrences.append(EventOccurrence(event_id=event.id, day=day))
+        if len(occurrences) >= 1000:
+            EventOccurrence.objects.bulk_create(occurrences)
+            occurrences = []
+    EventOccurrence.objects.bulk_create(occurrences)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mezzanine_agenda', '0030_geocoderesult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventOccurrence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='day')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='mezzanine_agenda.Event', verbose_name='event')),
+            ],
+            options={
+                'ordering': ('day',),
+                'verbose_name': 'Event occurrence',
+                'verbose_name_plural': 'Event occurrences',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventoccurrence',
+            unique_together=set([('day', 'event')]),
+        ),
+        migrations.RunPython(build_occurrences, migrations.RunPython.noop),
+    ]
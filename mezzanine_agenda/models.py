@@ -1,31 +1,85 @@
 from __future__ import unicode_literals
 from future.builtins import str
 
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models import Q
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
-from django.utils.translation import ugettext_lazy as _
+from django.utils import timezone
+from django.utils.translation import get_language, get_supported_language_variant, \
+    ugettext_lazy as _
 from django.conf import settings
 
-from geopy.geocoders import GoogleV3 as GoogleMaps
-from geopy.exc import GeocoderQueryError
-
+from geopy.exc import GeopyError
 from icalendar import Event as IEvent
+from collections import OrderedDict
 from copy import deepcopy
+from bisect import bisect_left
+from datetime import date, timedelta
+from functools import partial
+import threading
 
 from mezzanine.conf import settings
 from mezzanine.core.fields import FileField, RichTextField, OrderField
 from mezzanine.core.models import Displayable, Ownable, RichText, Slugged
 from mezzanine.generic.fields import CommentsField, RatingField
+from mezzanine.generic.models import Keyword
 from mezzanine.utils.models import AdminThumbMixin, upload_to
 from mezzanine.utils.sites import current_site_id
 from mezzanine.utils.models import base_concrete_model, get_user_model_name
 
+from mezzanine_agenda.cache import clear_excluded_keyword_ids, clear_site_domains, \
+    get_site_domain, invalidate_scope, invalidate_site, process_cache, record_cache_access
+from mezzanine_agenda.geocoding import GeocodeError, GeocodeUnavailable, get_geocoder, \
+    normalize_address, submit
+from mezzanine_agenda.utils import event_days
+
 
 ALIGNMENT_CHOICES = (('left', _('left')), ('center', _('center')), ('right', _('right')))
 
+# Fields children take from their parent event. The first ones are always
+# inherited, the others only when the child doesn't have its own value.
+PARENT_FIELDS = ('title', 'user', 'status')
+PARENT_DEFAULT_FIELDS = ('location', 'category', 'description', 'mentions', 'content')
+
+# Relations copied from parent events, with the fields identifying
+# a copied row if the child may also have rows of its own.
+PARENT_RELATIONS = (
+    ('images', ('file', 'type')),
+    ('departments', None),
+    ('links', None),
+)
+
+
+def _inherited_attnames(field_names=PARENT_FIELDS + PARENT_DEFAULT_FIELDS):
+    """
+    Return the column attribute names of the given event fields,
+    followed by those of their translations.
+    """
+    event_field_names = set(field.name for field in Event._meta.concrete_fields)
+    names = []
+    for field_name in field_names:
+        names.append(Event._meta.get_field(field_name).attname)
+        for code, language in settings.LANGUAGES:
+            translated = "%s_%s" % (field_name, code.replace("-", "_"))
+            if translated in event_field_names:
+                names.append(translated)
+    return names
+
+
+GEOCODE_PENDING = 'pending'
+GEOCODE_DONE = 'done'
+GEOCODE_FAILED = 'failed'
+GEOCODE_STATUS_CHOICES = (
+    (GEOCODE_PENDING, _('pending')),
+    (GEOCODE_DONE, _('done')),
+    (GEOCODE_FAILED, _('failed')),
+)
+
 
 class SubTitle(models.Model):
 
@@ -69,6 +123,15 @@ class Event(Displayable, SubTitle, Ownable, RichText, AdminThumbMixin):
         verbose_name = _("Event")
         verbose_name_plural = _("Events")
         ordering = ("rank", "start",)
+        # Upcoming/ongoing and archive listings filter on status and
+        # dates, location and author listings on their foreign key.
+        index_together = (
+            ("status", "start"),
+            ("status", "end"),
+            ("rank", "start"),
+            ("location", "start"),
+            ("user", "start"),
+        )
 
     def clean(self):
         """
@@ -79,52 +142,136 @@ class Event(Displayable, SubTitle, Ownable, RichText, AdminThumbMixin):
         if self.end and self.start > self.end:
             raise ValidationError("Start must be sooner than end.")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Event, cls).from_db(db, field_names, values)
+        # Keep the loaded values so that children still holding them
+        # can be told apart from children with values of their own.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def save(self, *args, **kwargs):
-        super(Event, self).save(*args, **kwargs)
-        # take some values from parent
-        if not self.parent is None:
-            self.title = self.parent.title
-            self.user = self.parent.user
-            self.status = self.parent.status
-            if not self.location:
-                self.location = self.parent.location
-            if not self.description:
-                self.description = self.parent.description
-                self.description_en = self.parent.description_en
-            if not self.category:
-                self.category = self.parent.category
-            if not self.mentions:
-                self.mentions = self.parent.mentions
-                self.mentions_en = self.parent.mentions_en
-            parent_images = self.parent.images.select_related('event').all()
-            for parent_image in parent_images:
-                if not self.images.filter(file=parent_image.file, type=parent_image.type):
-                    parent_image.pk = None
-                    parent_image.save()
-                    parent_image.event = self
-                    parent_image.save()
-            if not self.user:
-                self.user = self.parent.user
-            if not self.status:
-                self.status = self.parent.status
-            if not self.content:
-                self.content = self.parent.content
-                self.content_en = self.parent.content_en
-            if not self.departments.all():
-                parent_departments = self.parent.departments.all()
-                for parent_department in parent_departments:
-                    parent_department.pk = None
-                    parent_department.save()
-                    parent_department.event = self
-                    parent_department.save()
-            if not self.links.all():
-                all_links = self.parent.links.all()
-                for link in all_links:
-                    link.pk = None
-                    link.save()
-                    link.event = self
-                    link.save()
-        super(Event, self).save(*args, **kwargs)
+        adding = self._state.adding
+        with transaction.atomic():
+            # take some values from parent
+            if not self.parent is None:
+                self.inherit_parent_fields()
+            super(Event, self).save(*args, **kwargs)
+            if not self.parent is None:
+                for name, match_fields in PARENT_RELATIONS:
+                    self.parent.copy_relation(name, match_fields, [self.id])
+            if not adding:
+                self.update_children()
+            self.update_occurrences()
+        self._loaded_values = dict((name, getattr(self, name))
+                                   for name in _inherited_attnames())
+
+    def inherit_parent_fields(self):
+        """
+        Take the title, author and status from the parent, along with
+        the location, category, description, mentions and content if
+        the event doesn't have its own.
+        """
+        for name in _inherited_attnames(PARENT_FIELDS):
+            setattr(self, name, getattr(self.parent, name))
+        for field_name in PARENT_DEFAULT_FIELDS:
+            names = _inherited_attnames([field_name])
+            if not getattr(self, names[0]):
+                for name in names:
+                    setattr(self, name, getattr(self.parent, name))
+
+    def update_children(self, previous=None):
+        """
+        Push the inherited fields and relations down the whole tree of
+        children of the event, a level at a time with set based
+        updates, so the number of queries depends on the depth of the
+        tree but not on the number of children. Children holding
+        ``previous`` values of the event, which default to the values it
+        was loaded with, or no value at all take the current ones.
+        Below the first level, only children of events which took the
+        current value take it in turn.
+        """
+        if previous is None:
+            previous = getattr(self, "_loaded_values", {})
+        values = dict((name, getattr(self, name))
+                      for name in _inherited_attnames(PARENT_FIELDS))
+        values["updated"] = timezone.now()
+        synced = set([self.id])
+        parents = [self.id]
+        while parents:
+            # A plain queryset, so modeltranslation doesn't rewrite fields.
+            children = models.QuerySet(model=Event).filter(parent_id__in=parents)
+            parent_ids = dict(children.exclude(id__in=synced).values_list("id", "parent_id"))
+            if not parent_ids:
+                return
+            children = models.QuerySet(model=Event).filter(id__in=list(parent_ids))
+            children.update(**values)
+            for name in _inherited_attnames(PARENT_DEFAULT_FIELDS):
+                field = Event._meta.get_field(name)
+                value = getattr(self, name)
+                inherited = Q(**{"%s__isnull" % name: True})
+                if not field.is_relation:
+                    inherited |= Q(**{name: ""})
+                if previous.get(name) not in (None, ""):
+                    inherited |= Q(**{name: previous[name]})
+                if parents != [self.id]:
+                    if value is None:
+                        inherited &= Q(**{"parent__%s__isnull" % name: True})
+                    else:
+                        inherited &= Q(**{"parent__%s" % name: value})
+                children.filter(inherited).update(**{name: value})
+            for name, match_fields in PARENT_RELATIONS:
+                self.copy_relation(name, match_fields, list(parent_ids), parent_ids)
+            synced.update(parent_ids)
+            parents = list(parent_ids)
+
+    def copy_relation(self, name, match_fields, children_ids, parent_ids=None):
+        """
+        Copy the rows of the ``name`` relation of their parent to the
+        children missing them, reading the rows of all the events with
+        one query and creating the copies with another. The parent of
+        each child is looked up in ``parent_ids`` and defaults to the
+        event. With ``match_fields``, a row is missing if the child has
+        no row with the same values for these fields, otherwise rows are
+        only copied to children which have none. Relations which aren't
+        installed are skipped.
+        """
+        related = getattr(self, name, None)
+        if related is None:
+            return
+        field = related.field
+        if parent_ids is None:
+            parent_ids = dict((child_id, self.id) for child_id in children_ids)
+        event_ids = set(parent_ids.values()) | set(children_ids)
+        rows = related.model.objects.filter(**{"%s__in" % field.name: list(event_ids)})
+        parents_rows = dict((parent_id, []) for parent_id in parent_ids.values())
+        children_values = dict((child_id, set()) for child_id in children_ids)
+        for row in rows:
+            event_id = getattr(row, field.attname)
+            if event_id in parents_rows:
+                parents_rows[event_id].append(row)
+            if event_id not in children_values:
+                continue
+            if match_fields:
+                children_values[event_id].add(tuple(getattr(row, f) for f in match_fields))
+            else:
+                children_values.pop(event_id)
+        missing = []
+        for child_id, values in children_values.items():
+            for row in parents_rows[parent_ids[child_id]]:
+                if not match_fields or tuple(getattr(row, f) for f in match_fields) not in values:
+                    row = deepcopy(row)
+                    row.pk = None
+                    setattr(row, field.attname, child_id)
+                    missing.append(row)
+        related.model.objects.bulk_create(missing)
+
+    def update_occurrences(self):
+        """
+        Rebuild the days covered by the event.
+        """
+        self.occurrences.all().delete()
+        EventOccurrence.objects.bulk_create(EventOccurrence.build([self]))
 
     def update(self, *args, **kwargs):
         super(Event, self).save(*args, **kwargs)
@@ -155,14 +302,32 @@ class Event(Displayable, SubTitle, Ownable, RichText, AdminThumbMixin):
                     break
         return reverse(url_name, kwargs=kwargs)
 
+    def get_icalendar_cache_key(self, language=None, site_id=None):
+        """
+        Returns the cache key of the serialized VEVENT of the event. The
+        key changes whenever the event is updated, or the domain of its
+        site changes. Regional variants of a language, such as ``en-us``,
+        share the key of the language in the ``LANGUAGES`` setting.
+        """
+        site_id = site_id or current_site_id()
+        updated = self.updated.strftime("%Y%m%d%H%M%S%f") if self.updated else ""
+        return "mezzanine_agenda.vevent.{site}.{domain}.{id}.{updated}.{language}".format(
+            site=site_id,
+            domain=get_site_domain(site_id),
+            id=self.id,
+            updated=updated,
+            language=_icalendar_language(language or get_language()),
+        )
+
     def get_icalendar_event(self):
         """
         Builds an icalendar.event object from event data.
         """
+        domain = get_site_domain()
         icalendar_event = IEvent()
         icalendar_event.add('summary'.encode("utf-8"), self.title)
         icalendar_event.add('url', 'http://{domain}{url}'.format(
-            domain=Site.objects.get(id=current_site_id()).domain,
+            domain=domain,
             url=self.get_absolute_url(),
         ))
         if self.location:
@@ -173,7 +338,7 @@ class Event(Displayable, SubTitle, Ownable, RichText, AdminThumbMixin):
             icalendar_event.add('dtend', self.end)
         icalendar_event['uid'.encode("utf-8")] = "event-{id}@{domain}".format(
             id=self.id,
-            domain=Site.objects.get(id=current_site_id()).domain,
+            domain=domain,
         ).encode("utf-8")
         return icalendar_event
 
@@ -209,12 +374,64 @@ class Event(Displayable, SubTitle, Ownable, RichText, AdminThumbMixin):
         return self._get_next_or_previous_by_start_date(False, **kwargs)
 
     def date_format(self):
-        if self.periods.all():
+        # Periods are a relation added by projects, prefetch them when
+        # listing events.
+        periods = getattr(self, "periods", None)
+        if periods is not None and periods.all():
             return 'D j F'
         else:
             return 'l j F'
 
 
+class EventOccurrence(models.Model):
+    """
+    A day covered by an event, in the event time zone. Occurrences are
+    rebuilt whenever an event is saved, so calendar grids are read with
+    a single range query which includes the days in between the start
+    and end of multi-day events.
+    """
+
+    event = models.ForeignKey(Event, verbose_name=_('event'), related_name='occurrences', on_delete=models.CASCADE)
+    day = models.DateField(_('day'))
+
+    class Meta:
+        verbose_name = _("Event occurrence")
+        verbose_name_plural = _("Event occurrences")
+        unique_together = (("day", "event"),)
+        ordering = ("day",)
+
+    def __str__(self):
+        return "%s: %s" % (self.day, self.event)
+
+    @classmethod
+    def build(cls, events):
+        """
+        Return unsaved occurrences for the days the events cover.
+        """
+        return [cls(event_id=event.id, day=day) for event in events
+                for day in event_days(event.start, event.end)]
+
+    @classmethod
+    def events_by_day(cls, first_day, last_day, events=None):
+        """
+        Return a dict with the date and the events covering it for each
+        day from ``first_day`` to ``last_day``, read with one query.
+        Events default to the published ones.
+        """
+        if events is None:
+            events = Event.objects.published()
+        occurrences = cls.objects.filter(day__range=(first_day, last_day), event__in=events)
+        occurrences = occurrences.select_related("event").order_by("day", "event__start")
+        days = OrderedDict()
+        day = first_day
+        while day <= last_day:
+            days[day] = []
+            day += timedelta(days=1)
+        for occurrence in occurrences:
+            days[occurrence.day].append(occurrence.event)
+        return [{"date": day, "events": events} for day, events in days.items()]
+
+
 class EventLocation(Slugged):
     """
     A Event Location.
@@ -230,6 +447,7 @@ class EventLocation(Slugged):
     description = RichTextField(_('description'), blank=True)
     link = models.URLField(max_length=512, blank=True, null=True)
     external_id = models.IntegerField(_('external_id'), null=True, blank=True)
+    geocode_status = models.CharField(_('geocode status'), max_length=16, choices=GEOCODE_STATUS_CHOICES, blank=True, editable=False)
 
     class Meta:
         verbose_name = _("Event Location")
@@ -239,6 +457,8 @@ class EventLocation(Slugged):
     def clean(self):
         """
         Validate set/validate mappable_location, longitude and latitude.
+        If ``EVENT_GEOCODE_ASYNC`` is enabled, geocoding is left to a
+        background job and the location is marked as pending.
         """
         super(EventLocation, self).clean()
 
@@ -252,20 +472,35 @@ class EventLocation(Slugged):
             self.mappable_location = self.address.replace("\n"," ").replace('\r', ' ') + ", " + self.postal_code + " " + self.city
 
         if self.mappable_location and not (self.lat and self.lon): #location should always override lat/long if set
-            g = GoogleMaps(api_key=settings.GOOGLE_API_KEY,domain=settings.EVENT_GOOGLE_MAPS_DOMAIN)
-            try:
-                mappable_location, (lat, lon) = g.geocode(self.mappable_location)
-            except GeocoderQueryError as e:
-                raise ValidationError("The mappable location you specified could not be found on {service}: \"{error}\" Try changing the mappable location, removing any business names, or leaving mappable location blank and using coordinates from getlatlon.com.".format(service="Google Maps", error=e))
-            except ValueError as e:
-                raise ValidationError("The mappable location you specified could not be found on {service}: \"{error}\" Try changing the mappable location, removing any business names, or leaving mappable location blank and using coordinates from getlatlon.com.".format(service="Google Maps", error=e.message))
-            self.mappable_location = mappable_location
-            self.lat = lat
-            self.lon = lon
-
-    def save(self):
+            if settings.EVENT_GEOCODE_ASYNC:
+                self.geocode_status = GEOCODE_PENDING
+            else:
+                try:
+                    self.geocode()
+                except GeocodeUnavailable as e:
+                    raise ValidationError("The geocoder couldn't be reached, please try again later: \"{error}\"".format(error=e))
+
+    def geocode(self):
+        """
+        Set latitude and longitude from the mappable location with the
+        ``EVENT_GEOCODER`` backend, or from a previous geocoder result
+        for the same address. ``GeocodeUnavailable`` is raised if the
+        geocoder fails.
+        """
+        geocoder = get_geocoder()
+        result = GeocodeResult.lookup(self.mappable_location, geocoder)
+        if result.lat is None:
+            raise ValidationError("The mappable location you specified could not be found on {service}: \"{error}\" Try changing the mappable location, removing any business names, or leaving mappable location blank and using coordinates from getlatlon.com.".format(service=geocoder.name, error=result.error))
+        self.mappable_location = result.address
+        self.lat = result.lat
+        self.lon = result.lon
+        self.geocode_status = GEOCODE_DONE
+
+    def save(self, *args, **kwargs):
         self.clean()
-        super(EventLocation, self).save()
+        super(EventLocation, self).save(*args, **kwargs)
+        if self.geocode_status == GEOCODE_PENDING and settings.EVENT_GEOCODE_WORKERS:
+            transaction.on_commit(partial(submit, _geocode_in_background, self.pk))
 
     def __str__(self):
         return str(self.title + " - " + self.room)
@@ -275,6 +510,110 @@ class EventLocation(Slugged):
         return ("event_list_location", (), {"location": self.slug})
 
 
+class GeocodeResult(models.Model):
+    """
+    A geocoder result for a normalized mappable location. Addresses which
+    couldn't be found are kept without coordinates, and are geocoded
+    again once ``EVENT_GEOCODE_NEGATIVE_TTL`` has passed.
+    """
+
+    query = models.CharField(_('query'), max_length=255, unique=True)
+    address = models.CharField(_('address'), max_length=255, blank=True)
+    lat = models.DecimalField(max_digits=10, decimal_places=7, blank=True, null=True, verbose_name="Latitude")
+    lon = models.DecimalField(max_digits=10, decimal_places=7, blank=True, null=True, verbose_name="Longitude")
+    error = models.CharField(_('error'), max_length=255, blank=True)
+    updated = models.DateTimeField(_('updated'), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Geocode result")
+        verbose_name_plural = _("Geocode results")
+
+    def __str__(self):
+        return self.query
+
+    def is_expired(self):
+        if self.lat is not None:
+            return False
+        ttl = timedelta(seconds=settings.EVENT_GEOCODE_NEGATIVE_TTL)
+        return self.updated < timezone.now() - ttl
+
+    @classmethod
+    def lookup(cls, address, geocoder):
+        """
+        Return the result for the address, only calling the geocoder if
+        there is no result yet or it has expired. Geocoder failures
+        raise ``GeocodeUnavailable`` and aren't stored.
+        """
+        query = normalize_address(address)
+        result = cls.objects.filter(query=query).first()
+        if result is not None and not result.is_expired():
+            record_cache_access("geocode", hits=1)
+            return result
+        record_cache_access("geocode", misses=1)
+        defaults = {"address": "", "lat": None, "lon": None, "error": ""}
+        try:
+            found = geocoder.geocode(address)
+        except GeocodeError as e:
+            defaults["error"] = str(e)[:255]
+        except GeopyError as e:
+            raise GeocodeUnavailable(e)
+        else:
+            if found is None:
+                defaults["error"] = "no result"
+            else:
+                defaults["address"], (defaults["lat"], defaults["lon"]) = found
+        result, created = cls.objects.update_or_create(query=query, defaults=defaults)
+        return result
+
+
+def geocode_pending_locations(locations=None):
+    """
+    Geocode the given locations, or every location waiting for it, and
+    return the numbers of locations geocoded and failed. Locations are
+    left pending while the geocoder is unavailable.
+    """
+    if locations is None:
+        locations = EventLocation.objects.filter(geocode_status=GEOCODE_PENDING)
+    geocoded = failed = 0
+    for location in locations:
+        try:
+            location.geocode()
+            geocoded += 1
+        except GeocodeUnavailable:
+            continue
+        except ValidationError:
+            location.geocode_status = GEOCODE_FAILED
+            failed += 1
+        # Update the row directly so that saving doesn't geocode again.
+        EventLocation.objects.filter(pk=location.pk).update(
+            mappable_location=location.mappable_location,
+            lat=location.lat,
+            lon=location.lon,
+            geocode_status=location.geocode_status,
+        )
+    return geocoded, failed
+
+
+# Seconds to wait before geocoding a location in the background again
+# while the geocoder is unavailable.
+GEOCODE_RETRY_DELAYS = (10, 60, 300)
+
+
+def _geocode_in_background(location_id, attempt=0):
+    try:
+        locations = EventLocation.objects.filter(pk=location_id, geocode_status=GEOCODE_PENDING)
+        geocode_pending_locations(locations)
+        # Query again, ``locations`` holds the rows read before geocoding.
+        retry = attempt < len(GEOCODE_RETRY_DELAYS) and locations.all().exists()
+    finally:
+        connection.close()
+    if retry:
+        timer = threading.Timer(GEOCODE_RETRY_DELAYS[attempt], submit,
+                                (_geocode_in_background, location_id, attempt + 1))
+        timer.daemon = True
+        timer.start()
+
+
 class EventPrice(models.Model):
     """(EventPrice description)"""
 
@@ -349,3 +688,132 @@ class Season(models.Model):
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def default(cls, year):
+        """
+        Return an unsaved season from July 31st of ``year`` to August
+        1st of the next year, for years without a season.
+        """
+        return cls(title="Season %s-%s" % (year, year + 1),
+                   start=date(year, 7, 31), end=date(year + 1, 8, 1))
+
+    @classmethod
+    def all_cached(cls):
+        """
+        Return every season ordered by start date, querying them once
+        per process until a season is saved or deleted in any process.
+        """
+        season_cache = process_cache("seasons")
+        seasons = season_cache.get("seasons")
+        if seasons is None:
+            seasons = list(cls.objects.order_by("start", "id"))
+            season_cache["seasons"] = seasons
+        return seasons
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Forget the seasons read by ``all_cached`` in every process.
+        """
+        invalidate_scope("seasons")
+
+    @classmethod
+    def for_year(cls, year):
+        """
+        Return the season starting in ``year``, or the default season.
+        """
+        seasons = cls.all_cached()
+        i = bisect_left([season.start for season in seasons], date(year, 1, 1))
+        if i < len(seasons) and seasons[i].start.year == year:
+            return seasons[i]
+        return cls.default(year)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_event_cache(sender, instance, **kwargs):
+    """
+    Drop the cached agenda aggregates of the event's site.
+    """
+    invalidate_site(instance.site_id)
+
+
+def _icalendar_language(language):
+    try:
+        return get_supported_language_variant(language)
+    except LookupError:
+        return language
+
+
+def _delete_icalendar_cache(events):
+    keys = [event.get_icalendar_cache_key(language=code, site_id=event.site_id)
+            for event in events for code, name in settings.LANGUAGES]
+    cache.delete_many(keys)
+
+
+@receiver(post_delete, sender=Event)
+def delete_icalendar_cache(sender, instance, **kwargs):
+    """
+    Drop the cached VEVENT of a deleted event.
+    """
+    _delete_icalendar_cache([instance])
+
+
+@receiver(post_save, sender=EventLocation)
+@receiver(pre_delete, sender=EventLocation)
+def delete_location_icalendar_cache(sender, instance, **kwargs):
+    """
+    Drop the cached VEVENTs of the events at a changed location.
+    """
+    events = Event.objects.filter(location=instance).only("id", "updated", "site")
+    _delete_icalendar_cache(events)
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def clear_site_domain_cache(sender, **kwargs):
+    """
+    Forget resolved site domains when a site changes.
+    """
+    clear_site_domains()
+
+
+@receiver(post_save, sender=EventLocation)
+@receiver(post_delete, sender=EventLocation)
+def invalidate_location_cache(sender, instance, **kwargs):
+    """
+    Drop the cached agenda values of the location's site, such as its
+    filter choices, facets and aggregates, when a location changes.
+    """
+    invalidate_site(instance.site_id)
+
+
+@receiver(post_save, sender=EventCategory)
+@receiver(post_delete, sender=EventCategory)
+def invalidate_category_cache(sender, instance, **kwargs):
+    """
+    Drop the cached filter choices and facets when a category changes.
+    Categories are shared by every site.
+    """
+    invalidate_scope("categories")
+
+
+@receiver(post_save, sender=Season)
+@receiver(post_delete, sender=Season)
+def clear_season_cache(sender, **kwargs):
+    """
+    Read the seasons again when one changes.
+    """
+    Season.clear_cache()
+
+
+@receiver(post_save, sender=Keyword)
+@receiver(post_delete, sender=Keyword)
+def clear_excluded_keyword_cache(sender, instance, **kwargs):
+    """
+    Resolve the excluded keywords again and drop the cached keywords of
+    the keyword's site when a keyword changes.
+    """
+    clear_excluded_keyword_ids()
+    invalidate_site(instance.site_id)
@@ -0,0 +1,124 @@
+"""
+Keyset pagination of event listings.
+
+Pages are located with a cursor made of the start date and id of the
+event before or after them, and read with a range filter on
+``(start, id)`` instead of an offset. Every page costs one query,
+however deep it is, and no total count is needed.
+"""
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+from mezzanine.conf import settings
+
+
+CURSOR_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+class KeysetPage(object):
+    """
+    A page of events, with the cursors of the pages around it.
+    """
+
+    keyset = True
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self):
+        if self.has_next_page:
+            return encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous_page:
+            return encode_cursor(self.object_list[0])
+
+
+def page_querystring(querydict, name, value):
+    """
+    Return a query string with the page number or cursor of
+    ``querydict`` replaced by ``name`` set to ``value``.
+    """
+    querydict = querydict.copy()
+    for var in ("after", "before", "page"):
+        querydict.pop(var, None)
+    querydict[name] = value
+    return querydict.urlencode()
+
+
+def encode_cursor(event):
+    """
+    Return the cursor of an event.
+    """
+    start = event.start
+    if timezone.is_aware(start):
+        start = timezone.make_naive(start, timezone.utc)
+    return "%s-%d" % (start.strftime(CURSOR_FORMAT), event.id)
+
+
+def decode_cursor(cursor):
+    """
+    Return the start date and id a cursor is made of, or ``None`` if
+    the cursor isn't valid.
+    """
+    try:
+        start, id = cursor.split("-")
+        start = datetime.strptime(start, CURSOR_FORMAT)
+        id = int(id)
+    except (AttributeError, ValueError):
+        return None
+    if settings.USE_TZ:
+        start = timezone.make_aware(start, timezone.utc)
+    return start, id
+
+
+def keyset_paginate(events, per_page, after=None, before=None, descending=False):
+    """
+    Return the ``per_page`` events following the ``after`` cursor, or
+    preceding the ``before`` one, or the first ones if neither is
+    given. Events are ordered by start date and id, descending if
+    ``descending`` is set. Invalid cursors are ignored.
+    """
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+    # Going backwards reads the events in the opposite order.
+    forward = descending == backwards
+    if cursor is not None:
+        start, id = cursor
+        if forward:
+            events = events.filter(Q(start__gt=start) | Q(start=start, id__gt=id))
+        else:
+            events = events.filter(Q(start__lt=start) | Q(start=start, id__lt=id))
+    events = events.order_by(*(("start", "id") if forward else ("-start", "-id")))
+    events = list(events[:per_page + 1])
+    more = len(events) > per_page
+    events = events[:per_page]
+    if backwards:
+        events.reverse()
+        return KeysetPage(events, has_next=True, has_previous=more)
+    return KeysetPage(events, has_next=more, has_previous=cursor is not None)
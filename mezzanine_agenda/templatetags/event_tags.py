@@ -3,9 +3,10 @@
 from __future__ import unicode_literals
 
 from django import template
-from django.contrib.sites.models import Site
+from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
-from django.db.models import Count, Q
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
 from django.utils.http import urlquote as quote
 from django.utils.safestring import mark_safe
@@ -13,67 +14,105 @@ from django.utils import translation
 from django.template.defaultfilters import date as _date
 from django.utils.translation import ugettext as _
 
-from mezzanine_agenda.models import Event, EventLocation
+from mezzanine_agenda.models import Event, EventLocation, EventOccurrence, Season
 from mezzanine.conf import settings
 from mezzanine.core.managers import SearchableQuerySet
 from mezzanine.generic.models import Keyword
 from mezzanine.pages.models import Page
 from mezzanine.template import Library
 from mezzanine.utils.models import get_user_model
-from mezzanine.utils.sites import current_site_id
-from mezzanine_agenda.utils import sign_url
-
-import pytz
+from mezzanine_agenda.cache import cached_for_site, get_excluded_keyword_ids, get_site_domain
+from mezzanine_agenda.pagination import page_querystring
+from mezzanine_agenda.utils import get_event_timezone, sign_url
 
+from calendar import monthrange
 from time import strptime
 from datetime import date, datetime, timedelta
 import locale
 
-from mezzanine_agenda.views import next_weekday, week_day_range
+from mezzanine_agenda.windows import iso_week_range, overlapping, upcoming_window
 User = get_user_model()
 
 register = Library()
 
 
-@register.as_tag
-def event_months(*args):
+def _event_months():
     """
-    Put a list of dates for events into the template context.
+    Count published events per month, truncating start dates to the
+    month in the event time zone on the database side.
     """
-    if settings.EVENT_TIME_ZONE != "":
-        app_timezone = pytz.timezone(settings.EVENT_TIME_ZONE)
-    else:
-        app_timezone = timezone.get_default_timezone()
-    dates = Event.objects.published().values_list("start", flat=True)
-    correct_timezone_dates = [timezone.make_naive(date, app_timezone) for date in dates]
-    date_dicts = [{"date": datetime(date.year, date.month, 1)} for date in correct_timezone_dates]
+    app_timezone = get_event_timezone()
+    months = Event.objects.published().order_by()
+    months = months.annotate(month=TruncMonth("start", tzinfo=app_timezone))
+    months = months.values("month").annotate(event_count=Count("id"))
     month_dicts = []
-    for date_dict in date_dicts:
-        if date_dict not in month_dicts:
-            month_dicts.append(date_dict)
-    for i, date_dict in enumerate(month_dicts):
-        month_dicts[i]["event_count"] = date_dicts.count(date_dict)
+    for month in months.order_by("month"):
+        month_start = month["month"]
+        if timezone.is_aware(month_start):
+            month_start = timezone.make_naive(month_start, app_timezone)
+        month_dicts.append({
+            "date": datetime(month_start.year, month_start.month, 1),
+            "event_count": month["event_count"],
+        })
     return month_dicts
 
 
 @register.as_tag
-def event_locations(*args):
+def event_months(*args):
+    """
+    Put a list of dates for events into the template context.
+    """
+    return cached_for_site("event_months", _event_months)
+
+
+def _event_aggregate(queryset, relation, ordering, upcoming, limit):
     """
-    Put a list of locations for events into the template context.
+    Annotate ``queryset`` with the number of its published events,
+    upcoming ones only if ``upcoming`` is set, ordered by ``ordering``.
+    If ``limit`` is given, only that many with the most events are kept.
     """
     events = Event.objects.published()
-    locations = EventLocation.objects.filter(event__in=events)
-    return list(locations.annotate(event_count=Count("event")))
+    if upcoming:
+        events = overlapping(events, upcoming_window())
+    queryset = queryset.filter(**{"%s__in" % relation: events})
+    queryset = queryset.annotate(event_count=Count(relation))
+    if limit is not None:
+        return list(queryset.order_by("-event_count", ordering)[:int(limit)])
+    return list(queryset.order_by(ordering))
 
 
 @register.as_tag
-def event_authors(*args):
+def event_locations(upcoming=False, limit=None):
     """
-    Put a list of authors (users) for events into the template context.
+    Put a list of locations for events into the template context,
+    cached per site and language until an event changes.
+
+    Usage::
+
+        {% event_locations as locations %}
+        {% event_locations upcoming=True limit=10 as locations %}
+
     """
-    events = Event.objects.published()
-    authors = User.objects.filter(events__in=events)
-    return list(authors.annotate(event_count=Count("events")))
+    return cached_for_site("event_locations", lambda: _event_aggregate(
+        EventLocation.objects.all(), "event", "title", upcoming, limit),
+        parts=(translation.get_language(), bool(upcoming), limit))
+
+
+@register.as_tag
+def event_authors(upcoming=False, limit=None):
+    """
+    Put a list of authors (users) for events into the template context,
+    cached per site and language until an event changes.
+
+    Usage::
+
+        {% event_authors as authors %}
+        {% event_authors upcoming=True limit=10 as authors %}
+
+    """
+    return cached_for_site("event_authors", lambda: _event_aggregate(
+        User.objects.all(), "events", "username", upcoming, limit),
+        parts=(translation.get_language(), bool(upcoming), limit))
 
 
 @register.as_tag
@@ -132,7 +171,7 @@ def upcoming_events(limit=5, tag=None, username=None, location=None):
     """
     events = Event.objects.published().select_related("user").order_by('start')
     #Get upcoming events/ongoing events
-    events = events.filter(Q(start__gt=datetime.now()) | Q(end__gt=datetime.now()))
+    events = overlapping(events, upcoming_window())
     title_or_slug = lambda s: Q(title=s) | Q(slug=s)
     if tag is not None:
         try:
@@ -159,10 +198,7 @@ def _get_utc(datetime):
     """
     Convert datetime object to be timezone aware and in UTC.
     """
-    if settings.EVENT_TIME_ZONE != "":
-        app_timezone = pytz.timezone(settings.EVENT_TIME_ZONE)
-    else:
-        app_timezone = timezone.get_default_timezone()
+    app_timezone = get_event_timezone()
 
     # make the datetime aware
     if timezone.is_naive(datetime):
@@ -187,7 +223,7 @@ def google_calendar_url(event):
         end_date = _get_utc(event.end).strftime("%Y%m%dT%H%M%SZ")
     else:
         end_date = start_date
-    url = Site.objects.get(id=current_site_id()).domain + event.get_absolute_url()
+    url = get_site_domain() + event.get_absolute_url()
     if event.location:
         location = quote(event.location.mappable_location)
     else:
@@ -254,6 +290,14 @@ def icalendar_url(context):
         else:
             return reverse("icalendar")
 
+@register.simple_tag(takes_context=True)
+def cursor_querystring(context, name, cursor):
+    """
+    Return the current query string with the keyset pagination cursor
+    replaced by the given one.
+    """
+    return page_querystring(context["request"].GET, name, cursor)
+
 @register.as_tag
 def all_events(*args):
     return Event.objects.all()
@@ -266,28 +310,127 @@ def perdelta(start, end, delta):
 
 @register.as_tag
 def all_days(*args):
-    events = Event.objects.all().order_by('start')
-    if events:
-        lower = events[0].start
-        higher = events.latest('start').start
-        date_list = [d for d in perdelta(lower, higher, timedelta(days=1))]
-        return date_list
+    dates = Event.objects.aggregate(lower=Min('start'), higher=Max('start'))
+    if dates['lower'] is not None:
+        return list(perdelta(dates['lower'], dates['higher'], timedelta(days=1)))
     return []
 
 @register.filter
 def events_in_day(date):
-    return Event.objects.filter(start__date=date)
+    return Event.objects.filter(occurrences__day=date)
+
+
+def _season_bounds(year):
+    season = Season.for_year(year)
+    return season.start, season.end
+
+
+@register.as_tag
+def month_event_days(year, month):
+    """
+    Put the days of a month, each with the published events covering
+    it, into the template context.
+
+    Usage::
+
+        {% month_event_days 2018 9 as days %}
+
+    """
+    year, month = int(year), int(month)
+    first_day = date(year, month, 1)
+    last_day = date(year, month, monthrange(year, month)[1])
+    return EventOccurrence.events_by_day(first_day, last_day)
+
+
+@register.as_tag
+def week_event_days(year, week):
+    """
+    Put the days of an ISO week, each with the published events
+    covering it, into the template context.
+
+    Usage::
+
+        {% week_event_days 2018 37 as days %}
+
+    """
+    first_day, last_day = iso_week_range(year, week)
+    return EventOccurrence.events_by_day(first_day, last_day)
+
+
+@register.as_tag
+def season_event_days(year):
+    """
+    Put the days of the season starting in the given year, each with
+    the published events covering it, into the template context.
+
+    Usage::
+
+        {% season_event_days 2018 as days %}
+
+    """
+    first_day, last_day = _season_bounds(int(year))
+    return EventOccurrence.events_by_day(first_day, last_day)
 
 @register.as_tag
 def all_weeks(*args):
-    events =  Event.objects.all()
-    first_event = events[0]
-    last_event = events[len(events)-1]
-    return range(first_event.start.isocalendar()[1], last_event.start.isocalendar()[1]+1)
+    dates = Event.objects.aggregate(first=Min('start'), last=Max('start'))
+    if dates['first'] is None:
+        return []
+    return range(dates['first'].isocalendar()[1], dates['last'].isocalendar()[1]+1)
+
+def _calendar_weeks(first_day, last_day):
+    """
+    Return the weeks from the Monday before ``first_day`` to the Sunday
+    after ``last_day``, read with a single query.
+    """
+    first_monday = first_day - timedelta(days=first_day.weekday())
+    last_sunday = last_day + timedelta(days=6 - last_day.weekday())
+    days = EventOccurrence.events_by_day(first_monday, last_sunday)
+    for day in days:
+        day["in_range"] = first_day <= day["date"] <= last_day
+    return [days[i:i + 7] for i in range(0, len(days), 7)]
+
+
+@register.as_tag
+def event_calendar(year, month):
+    """
+    Put the calendar of a month into the template context, as a list of
+    weeks from Monday to Sunday. Each day has its ``date``, the
+    published ``events`` covering it in the event time zone, and
+    ``in_range`` telling whether it belongs to the month.
+
+    Usage::
+
+        {% event_calendar 2018 9 as grid %}
+        {% for week in grid %}{% for day in week %}
+            {{ day.date.day }}{% for event in day.events %}...{% endfor %}
+        {% endfor %}{% endfor %}
+
+    """
+    year, month = int(year), int(month)
+    first_day = date(year, month, 1)
+    last_day = date(year, month, monthrange(year, month)[1])
+    return _calendar_weeks(first_day, last_day)
+
+
+@register.as_tag
+def event_week_calendar(year, week):
+    """
+    Put the calendar of an ISO week into the template context, in the
+    same format as ``event_calendar``.
+
+    Usage::
+
+        {% event_week_calendar 2018 37 as grid %}
+
+    """
+    first_day, last_day = iso_week_range(year, week)
+    return _calendar_weeks(first_day, last_day)
+
 
 @register.filter
 def week_range(week, year):
-    return week_day_range(year, week)
+    return iso_week_range(year, week)
 
 
 @register.filter
@@ -323,8 +466,23 @@ def same_day_in_periods(periods):
 
 @register.filter
 def tag_is_excluded(tag_id):
-    return tag_id in settings.EVENT_EXCLUDE_TAG_LIST
+    return tag_id in get_excluded_keyword_ids()
+
+def _event_keywords():
+    content_type = ContentType.objects.get_for_model(Event)
+    keywords = Keyword.objects.filter(assignments__content_type=content_type).distinct()
+    return dict((keyword.id, keyword) for keyword in keywords)
+
 
 @register.filter
 def get_tag(tag_id):
-    return Keyword.objects.get(id=tag_id)
+    """
+    Return the keyword with the given id. The keywords of events are
+    read at once and cached per site, so that looking up the keywords
+    of a listing doesn't cost a query per keyword.
+    """
+    keywords = cached_for_site("event_keywords", _event_keywords)
+    try:
+        return keywords[int(tag_id)]
+    except KeyError:
+        return Keyword.objects.get(id=tag_id)
@@ -5,25 +5,67 @@ try:
 except ImportError:
     from urlparse import urlparse
 
-from datetime import datetime, timedelta
+import json
+import re
+from datetime import date, datetime, timedelta
 
+import pytz
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext, modify_settings, override_settings
+from django.template import Context, Template
+from django.utils import translation
 from django.utils.unittest import skipUnless
+from geopy.exc import GeocoderTimedOut
 
-from mezzanine_agenda.models import Event, EventLocation
+from mezzanine_agenda.cache import clear_excluded_keyword_ids, clear_site_domains, \
+    get_cache_stats, invalidate_site, site_cache_key
+from mezzanine_agenda.dataset import TAG_TEMPLATES, dataset_tag_context, dataset_urls, \
+    generate_dataset
+from mezzanine_agenda.facets import event_facets
+from mezzanine_agenda.forms import EventFilterForm
+from mezzanine_agenda.instrumentation import get_stats, reset_stats
+from mezzanine_agenda.models import Event, EventCategory, EventLocation, GeocodeResult, Season, GEOCODE_DONE, \
+    GEOCODE_FAILED, GEOCODE_PENDING, PARENT_RELATIONS, geocode_pending_locations
+from mezzanine_agenda.pagination import keyset_paginate
+from mezzanine_agenda.views import LocationListView, _make_icalendar
+from mezzanine_agenda.windows import day_start, day_window, month_window, overlapping, \
+    season_window, upcoming_window, week_window, year_window
 from mezzanine.conf import settings
 
 from mezzanine.core.models import CONTENT_STATUS_DRAFT, CONTENT_STATUS_PUBLISHED
+from mezzanine.generic.models import Keyword
 from mezzanine.pages.models import RichTextPage
 from mezzanine.utils.tests import TestCase
 
 from datetime import datetime
 
 
+class TimeoutGeocoder(object):
+    """
+    A geocoder that always times out.
+    """
+
+    name = "timeout"
+
+    def geocode(self, address):
+        raise GeocoderTimedOut("timed out")
+
+
+# Locations are geocoded in the background, which never runs as test
+# transactions aren't committed, unless a test opts out.
+@override_settings(EVENT_GEOCODE_ASYNC=True)
 class EventTests(TestCase):
 
     def setUp(self):
         super(EventTests, self).setUp()
+        # Seasons read by a previous test may have been rolled back.
+        Season.clear_cache()
         self.eventlocation = EventLocation.objects.create(
             address='1 Susan St\nHindmarsh\nSouth Australia',
         )
@@ -101,6 +143,7 @@ class EventTests(TestCase):
         self.event_page.login_required=False
         self.event_page.save()
 
+    @override_settings(EVENT_GEOCODE_ASYNC=False)
     def test_clean(self):
         """
         Test the events geocoding functionality.
@@ -124,3 +167,888 @@ class EventTests(TestCase):
         response = self.client.get(reverse("icalendar"))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'text/calendar')
+
+    def test_event_months(self):
+        """
+        Test published events are counted per month and that the cached
+        counts are dropped when an event is saved.
+        """
+        template = Template("{% load event_tags %}{% event_months as months %}"
+                            "{% for month in months %}{{ month.event_count }}{% endfor %}")
+        self.assertEqual(template.render(Context()), "2")
+        with self.assertNumQueries(0):
+            self.assertEqual(template.render(Context()), "2")
+        Event.objects.create(title="Another event", start=datetime.now(),
+                             user=self._user, status=CONTENT_STATUS_PUBLISHED)
+        self.assertEqual(template.render(Context()), "3")
+
+    def test_icalendar_query_count(self):
+        """
+        Test the number of queries run by the icalendar view doesn't
+        depend on the number of events.
+        """
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse("icalendar"))
+            self.assertEqual(response.status_code, 200)
+            return len(context.captured_queries)
+        count_queries()
+        queries = count_queries()
+        for i in range(5):
+            Event.objects.create(title="Upcoming event %d" % i, user=self._user,
+                                 start=datetime.now() + timedelta(days=1),
+                                 location=self.eventlocation,
+                                 status=CONTENT_STATUS_PUBLISHED)
+        self.assertEqual(count_queries(), queries)
+
+    def test_icalendar_streaming(self):
+        """
+        Test streamed and assembled icalendars are the same as the
+        whole calendar serialized at once.
+        """
+        start = datetime.now() + timedelta(days=1)
+        new_york = pytz.timezone("America/New_York")
+        Event.objects.create(title="No location", start=start, status=CONTENT_STATUS_PUBLISHED,
+                             user=self._user)
+        Event.objects.create(title="New York", start=new_york.localize(start),
+                             end=new_york.localize(start + timedelta(days=2)),
+                             location=self.eventlocation, status=CONTENT_STATUS_PUBLISHED,
+                             user=self._user)
+        icalendar = _make_icalendar()
+        for event in Event.objects.filter(status=CONTENT_STATUS_PUBLISHED).order_by("start"):
+            icalendar.add_component(event.get_icalendar_event())
+        response = self.client.get(reverse("icalendar"))
+        self.assertEqual(response.content, icalendar.to_ical())
+        with override_settings(EVENT_ICALENDAR_STREAMING=True):
+            streamed_response = self.client.get(reverse("icalendar"))
+        self.assertTrue(streamed_response.streaming)
+        self.assertEqual(streamed_response['Content-Type'], 'text/calendar')
+        self.assertEqual(b"".join(streamed_response.streaming_content), icalendar.to_ical())
+
+    def test_conditional_get(self):
+        """
+        Test the icalendar and feed views answer conditional requests
+        until an event changes.
+        """
+        urls = (reverse("icalendar"), reverse("event_feed", args=("rss",)),
+                reverse("icalendar_event", args=(self.event.slug,)))
+        etags = {}
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etags[url] = response["ETag"]
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 304)
+        self.event.save()
+        for url in urls:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_changes(self):
+        """
+        Test conditional requests see events leaving the listing
+        without being saved, location changes and language changes.
+        """
+        url = reverse("icalendar")
+        for change in (lambda: Event.objects.filter(id=self.unicode_event.id).update(
+                           status=CONTENT_STATUS_DRAFT),
+                       lambda: Event.objects.filter(id=self.event.id).delete(),
+                       lambda: self.eventlocation.save()):
+            response = self.client.get(url)
+            self.assertNotIn("Last-Modified", response)
+            etag = response["ETag"]
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        etag = self.client.get(url)["ETag"]
+        with override_settings(LANGUAGES=(("en", "English"), ("fr", "French"))):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_LANGUAGE="fr")
+        self.assertEqual(response.status_code, 200)
+
+    def test_icalendar_cache(self):
+        """
+        Test icalendars are assembled from cached VEVENTs, which are
+        dropped in every language when the location of the event or the
+        site domain changes.
+        """
+        url = reverse("icalendar_event", args=(self.event.slug,))
+        response = self.client.get(url)
+        icalendar = _make_icalendar()
+        icalendar.add_component(self.event.get_icalendar_event())
+        self.assertEqual(response.content, icalendar.to_ical())
+        hits = get_cache_stats()["vevent_hits"]
+        self.assertEqual(self.client.get(url).content, response.content)
+        self.assertEqual(get_cache_stats()["vevent_hits"], hits + 1)
+        # Regional variants share the key dropped for their language.
+        with translation.override("en-us"):
+            self.assertEqual(self.event.get_icalendar_cache_key(),
+                             self.event.get_icalendar_cache_key(language="en"))
+        self.eventlocation.address = "2 Susan St"
+        self.eventlocation.save()
+        self.assertContains(self.client.get(url), "2 Susan St")
+        # The domain is rolled back after the test without signals.
+        self.addCleanup(clear_site_domains)
+        site = Site.objects.get(id=self.event.site_id)
+        site.domain = "agenda.example.com"
+        site.save()
+        self.assertContains(self.client.get(url), "event-%s@agenda.example.com" % self.event.id)
+
+    @override_settings(EVENT_GEOCODER="mezzanine_agenda.geocoding.LocalGeocoder",
+                       EVENT_LOCAL_GEOCODES={"Hindmarsh, 5007 Adelaide": (-34.907924, 138.567624)})
+    def test_geocode_pending_locations(self):
+        """
+        Test locations are saved without geocoding and geocoded later.
+        """
+        location = EventLocation.objects.create(title="Hindmarsh", address="Hindmarsh",
+                                                postal_code="5007", city="Adelaide")
+        unknown_location = EventLocation.objects.create(title="Nowhere", address="Nowhere",
+                                                        postal_code="0000", city="Nowhere")
+        self.assertEqual(location.geocode_status, GEOCODE_PENDING)
+        self.assertIsNone(location.lat)
+        self.assertEqual(geocode_pending_locations(
+            EventLocation.objects.filter(pk__in=(location.pk, unknown_location.pk))), (1, 1))
+        location = EventLocation.objects.get(pk=location.pk)
+        self.assertEqual(location.geocode_status, GEOCODE_DONE)
+        self.assertAlmostEqual(float(location.lat), -34.907924, places=5)
+        self.assertAlmostEqual(float(location.lon), 138.567624, places=5)
+        unknown_location = EventLocation.objects.get(pk=unknown_location.pk)
+        self.assertEqual(unknown_location.geocode_status, GEOCODE_FAILED)
+
+    @override_settings(EVENT_GEOCODER="mezzanine_agenda.tests.TimeoutGeocoder")
+    def test_geocode_unavailable(self):
+        """
+        Test geocoder failures leave locations pending without storing
+        a result, and are reported as validation errors on save.
+        """
+        location = EventLocation.objects.create(title="Hindmarsh", address="Hindmarsh",
+                                                postal_code="5007", city="Adelaide")
+        self.assertEqual(geocode_pending_locations(
+            EventLocation.objects.filter(pk=location.pk)), (0, 0))
+        self.assertEqual(EventLocation.objects.get(pk=location.pk).geocode_status,
+                         GEOCODE_PENDING)
+        self.assertFalse(GeocodeResult.objects.exists())
+        with override_settings(EVENT_GEOCODE_ASYNC=False):
+            self.assertRaises(ValidationError, EventLocation(
+                title="Hindmarsh", address="Hindmarsh", postal_code="5007",
+                city="Adelaide").clean)
+
+    @override_settings(EVENT_GEOCODER="mezzanine_agenda.geocoding.LocalGeocoder",
+                       EVENT_LOCAL_GEOCODES={"Hindmarsh, 5007 Adelaide": (-34.907924, 138.567624)})
+    def test_geocode_results(self):
+        """
+        Test addresses shared by several locations are geocoded once,
+        including the ones which couldn't be found.
+        """
+        locations = []
+        for room in ("Hall", "Studio"):
+            locations.append(EventLocation.objects.create(
+                title="Hindmarsh", address="Hindmarsh", postal_code="5007",
+                city="Adelaide", room=room))
+            locations.append(EventLocation.objects.create(
+                title="Nowhere", address="Nowhere", postal_code="0000",
+                city="Nowhere", room=room))
+        locations = EventLocation.objects.filter(pk__in=[l.pk for l in locations])
+        stats = get_cache_stats()
+        self.assertEqual(geocode_pending_locations(locations), (2, 2))
+        self.assertEqual(get_cache_stats()["geocode_misses"],
+                         stats.get("geocode_misses", 0) + 2)
+        self.assertEqual(get_cache_stats()["geocode_hits"],
+                         stats.get("geocode_hits", 0) + 2)
+        self.assertEqual(GeocodeResult.objects.count(), 2)
+
+    def test_child_event_save_queries(self):
+        """
+        Test a child event takes the values of its parent, is written
+        once, and costs a constant number of queries per relation.
+        """
+        standalone = Event(title="Standalone event", start=datetime.now(), user=self._user)
+        with CaptureQueriesContext(connection) as context:
+            standalone.save()
+        standalone_queries = len(context.captured_queries)
+        child = Event(parent=self.event, title="Child event", start=datetime.now(),
+                      user=self._user, status=CONTENT_STATUS_DRAFT)
+        with CaptureQueriesContext(connection) as context:
+            child.save()
+        relations = [name for name, fields in PARENT_RELATIONS if hasattr(self.event, name)]
+        self.assertLessEqual(len(context.captured_queries),
+                             standalone_queries + 2 * len(relations))
+        writes = [query["sql"] for query in context.captured_queries
+                  if query["sql"].startswith(("INSERT", "UPDATE")) and
+                  Event._meta.db_table in query["sql"].split("(")[0]]
+        self.assertEqual(len(writes), 1)
+        child = Event.objects.get(pk=child.pk)
+        self.assertEqual(child.title, self.event.title)
+        self.assertEqual(child.status, self.event.status)
+        self.assertEqual(child.location, self.event.location)
+
+    def test_copy_relation(self):
+        """
+        Test the rows of a relation missing from children are copied to
+        them with one query to read the rows and one to create them,
+        using occurrences as the relation.
+        """
+        children = [Event.objects.create(parent=self.event, title="Child",
+                                         start=datetime.now() + timedelta(days=10 + i),
+                                         user=self._user) for i in range(3)]
+        grandchild = Event.objects.create(parent=children[0], title="Grandchild",
+                                          start=datetime.now() + timedelta(days=20),
+                                          user=self._user)
+        children_ids = [child.id for child in children]
+        days = lambda event: set(event.occurrences.values_list("day", flat=True))
+        own_days = dict((event.id, days(event)) for event in children + [grandchild])
+        with self.assertNumQueries(2):
+            self.event.copy_relation("occurrences", ("day",), children_ids)
+        for child in children:
+            self.assertEqual(days(child), own_days[child.id] | days(self.event))
+        with self.assertNumQueries(1):
+            self.event.copy_relation("occurrences", ("day",), children_ids)
+        # Without match fields, only children without rows get copies.
+        children[1].occurrences.all().delete()
+        with self.assertNumQueries(2):
+            self.event.copy_relation("occurrences", None, children_ids)
+        self.assertEqual(days(children[1]), days(self.event))
+        self.assertEqual(days(children[2]), own_days[children[2].id] | days(self.event))
+        # Rows are copied from the parent given for each child.
+        with self.assertNumQueries(2):
+            self.event.copy_relation("occurrences", ("day",), [grandchild.id],
+                                     {grandchild.id: children[0].id})
+        self.assertEqual(days(grandchild), own_days[grandchild.id] | days(children[0]))
+
+    def test_parent_event_cascade(self):
+        """
+        Test saving a parent event updates its whole tree of children
+        with a number of queries which doesn't depend on the number of
+        children.
+        """
+        other_location = EventLocation.objects.create(title="Other", address="Other",
+                                                      lat=1, lon=1)
+        children = [Event.objects.create(parent=self.event, title="Child",
+                                         start=datetime.now(), user=self._user)]
+        own_location_child = Event.objects.create(parent=self.event, title="Child",
+                                                  start=datetime.now(), user=self._user,
+                                                  location=other_location)
+        grandchild = Event.objects.create(parent=children[0], title="Grandchild",
+                                          start=datetime.now(), user=self._user)
+        own_location_grandchild = Event.objects.create(parent=own_location_child,
+                                                       title="Grandchild",
+                                                       start=datetime.now(), user=self._user)
+
+        def save_parent(title):
+            self.event.title = title
+            with CaptureQueriesContext(connection) as context:
+                self.event.save()
+            return len(context.captured_queries)
+
+        queries = save_parent("Renamed event")
+        for i in range(5):
+            children.append(Event.objects.create(parent=self.event, title="Child",
+                                                 start=datetime.now(), user=self._user))
+        self.event = Event.objects.get(pk=self.event.pk)
+        self.event.location = self.unicode_eventlocation
+        self.assertEqual(save_parent("Renamed again"), queries)
+        for child in children:
+            child = Event.objects.get(pk=child.pk)
+            self.assertEqual(child.title, "Renamed again")
+            self.assertEqual(child.location, self.unicode_eventlocation)
+        own_location_child = Event.objects.get(pk=own_location_child.pk)
+        self.assertEqual(own_location_child.title, "Renamed again")
+        self.assertEqual(own_location_child.location, other_location)
+        grandchild = Event.objects.get(pk=grandchild.pk)
+        self.assertEqual(grandchild.title, "Renamed again")
+        self.assertEqual(grandchild.location, self.unicode_eventlocation)
+        own_location_grandchild = Event.objects.get(pk=own_location_grandchild.pk)
+        self.assertEqual(own_location_grandchild.title, "Renamed again")
+        self.assertEqual(own_location_grandchild.location, other_location)
+
+    def test_month_event_days(self):
+        """
+        Test multi-day events are listed on every day they cover, with a
+        single query for the whole month.
+        """
+        start = datetime(2018, 9, 10, 20)
+        event = Event.objects.create(title="Festival", start=start, end=start + timedelta(days=2),
+                                     user=self._user, status=CONTENT_STATUS_PUBLISHED)
+        template = Template("{% load event_tags %}{% month_event_days 2018 9 as days %}"
+                            "{% for day in days %}{{ day.date.day }}:{{ day.events|length }} "
+                            "{% endfor %}")
+        with self.assertNumQueries(1):
+            days = template.render(Context()).split()
+        self.assertEqual(len(days), 30)
+        self.assertEqual(days[8:13], ["9:0", "10:1", "11:1", "12:1", "13:0"])
+        event.delete()
+        self.assertNotIn("10:1", template.render(Context()))
+
+    def test_event_calendar(self):
+        """
+        Test the month calendar is made of whole weeks, read with a
+        single query.
+        """
+        start = datetime(2018, 9, 29, 20)
+        Event.objects.create(title="Weekend", start=start, end=start + timedelta(days=1),
+                             user=self._user, status=CONTENT_STATUS_PUBLISHED)
+        template = Template("{% load event_tags %}{% event_calendar 2018 9 as grid %}"
+                            "{% for week in grid %}{% for day in week %}"
+                            "{{ day.date|date:'md' }}:{{ day.in_range|yesno:'1,0' }}:"
+                            "{{ day.events|length }} {% endfor %}{% endfor %}")
+        with self.assertNumQueries(1):
+            days = template.render(Context()).split()
+        self.assertEqual(len(days), 35)
+        self.assertEqual(days[0], "0827:0:0")
+        self.assertEqual(days[-3:], ["0928:1:0", "0929:1:1", "0930:1:1"])
+
+    def test_event_week_calendar(self):
+        """
+        Test week calendars, week days and week listings follow ISO
+        week numbers.
+        """
+        template = Template("{% load event_tags %}{% event_week_calendar year week as grid %}"
+                            "{% for week in grid %}{% for day in week %}{{ day.date|date:'Y-m-d' }} "
+                            "{% endfor %}{% endfor %}")
+        days_template = Template("{% load event_tags %}{% week_event_days year week as days %}"
+                                 "{% for day in days %}{{ day.date|date:'Y-m-d' }} {% endfor %}")
+        for year, week, monday in ((2018, 1, "2018-01-01"), (2016, 1, "2016-01-04"),
+                                   (2015, 53, "2015-12-28")):
+            context = Context({"year": year, "week": week})
+            days = template.render(context).split()
+            self.assertEqual(days[0], monday)
+            self.assertEqual(len(days), 7)
+            self.assertEqual(days_template.render(context).split(), days)
+            self.assertEqual(week_window(year, week).start.date().isoformat(), monday)
+
+    def assertUsesIndex(self, queryset):
+        """
+        Assert the database reads events through an index for the
+        queryset rather than scanning the whole table.
+        """
+        sql, params = queryset.query.sql_with_params()
+        table = Event._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+                self.assertFalse([line for line in plan if
+                                  re.match(r"SCAN (TABLE )?%s( AS \w+)?$" % table, line)], plan)
+                self.assertTrue([line for line in plan if "INDEX" in line], plan)
+            elif connection.vendor == "postgresql":
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN " + sql, params)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+                self.assertNotIn("Seq Scan on %s" % table, plan)
+                self.assertIn("Index", plan)
+            else:
+                self.skipTest("EXPLAIN isn't checked on %s" % connection.vendor)
+
+    def test_event_indexes(self):
+        """
+        Test the upcoming, archive and location listings use indexes.
+        """
+        now = datetime.now()
+        events = Event.objects.published()
+        self.assertUsesIndex(events.filter(Q(start__gt=now) | Q(end__gt=now)))
+        self.assertUsesIndex(events.filter(start__range=(now - timedelta(days=365), now))
+                             .order_by("-start"))
+        self.assertUsesIndex(events.filter(location=self.eventlocation).order_by("start"))
+        self.assertUsesIndex(overlapping(events, month_window(now.year, now.month)))
+
+    @override_settings(EVENT_INSTRUMENTATION=True)
+    @modify_settings(MIDDLEWARE_CLASSES={
+        "append": "mezzanine_agenda.instrumentation.AgendaInstrumentationMiddleware"})
+    def test_instrumentation(self):
+        """
+        Test agenda responses are timed and their statistics recorded.
+        """
+        reset_stats()
+        response = self.client.get(reverse("event_list"))
+        self.assertIn("Server-Timing", response)
+        response = self.client.get(reverse("icalendar"))
+        self.assertIn("Server-Timing", response)
+        self.assertNotIn("cursor", vars(connections[DEFAULT_DB_ALIAS]))
+        self.assertFalse(connection.force_debug_cursor)
+        stats = get_stats()
+        self.assertEqual(stats["EventListView"]["requests"], 1)
+        self.assertGreater(stats["EventListView"]["queries"], 0)
+        self.assertEqual(stats["icalendar"]["bytes"], len(response.content))
+        with override_settings(EVENT_INSTRUMENTATION=False):
+            response = self.client.get(reverse("event_list"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(get_stats()["EventListView"]["requests"], 1)
+        reset_stats()
+
+    def test_keyset_pagination(self):
+        """
+        Test walking through keyset pages in both directions, one query
+        per page.
+        """
+        start = datetime(2018, 9, 1, 20)
+        for i in range(7):
+            Event.objects.create(title="Keyset %d" % i, slug="keyset-%d" % i,
+                                 start=start + timedelta(days=i // 2), user=self._user)
+        events = Event.objects.filter(slug__startswith="keyset-")
+        for descending in (False, True):
+            ordered = list(events.order_by(*(("-start", "-id") if descending
+                                             else ("start", "id"))))
+            pages = []
+            page = keyset_paginate(events, 3, descending=descending)
+            pages.append(page.object_list)
+            while page.has_next():
+                with self.assertNumQueries(1):
+                    page = keyset_paginate(events, 3, after=page.next_cursor,
+                                           descending=descending)
+                pages.append(page.object_list)
+            self.assertEqual([event for page in pages for event in page], ordered)
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+            page = keyset_paginate(events, 3, before=page.previous_cursor,
+                                   descending=descending)
+            self.assertEqual(page.object_list, pages[1])
+            self.assertTrue(page.has_previous())
+            page = keyset_paginate(events, 3, before=page.previous_cursor,
+                                   descending=descending)
+            self.assertEqual(page.object_list, pages[0])
+            self.assertFalse(page.has_previous())
+        self.assertEqual(keyset_paginate(events, 3, after="invalid").object_list,
+                         ordered[::-1][:3])
+
+    @override_settings(EVENT_PAGINATION="keyset")
+    def test_keyset_pagination_views(self):
+        """
+        Test listings link to the next page with a cursor.
+        """
+        for i in range(settings.EVENT_PER_PAGE):
+            Event.objects.create(title="Keyset %d" % i, slug="keyset-%d" % i,
+                                 start=datetime.now() + timedelta(days=i + 1),
+                                 status=CONTENT_STATUS_PUBLISHED, user=self._user)
+        response = self.client.get(reverse("event_list"))
+        self.assertFalse(response.context["events"].has_previous())
+        next_cursor = response.context["events"].next_cursor
+        self.assertContains(response, "after=%s" % next_cursor)
+        response = self.client.get(reverse("event_list"), {"after": next_cursor})
+        self.assertTrue(response.context["events"].has_previous())
+
+    def test_event_list_json(self):
+        """
+        Test the JSON listing only reads and returns the requested fields.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("event_list"), {"fields": "title,url"},
+                                       HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+            data = json.loads(b"".join(response.streaming_content).decode("utf-8"))
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(sorted(data["events"], key=lambda event: event["url"]),
+                         sorted([{"title": event.title, "url": event.get_absolute_url()}
+                                 for event in self.events], key=lambda event: event["url"]))
+        self.assertIsNone(data["next"])
+        event_queries = [query["sql"] for query in context.captured_queries
+                         if 'FROM "mezzanine_agenda_event"' in query["sql"]]
+        self.assertTrue(event_queries)
+        self.assertFalse([sql for sql in event_queries if '"content' in sql])
+        response = self.client.get(reverse("event_list"),
+                                   {"format": "json", "fields": "title,password"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_excluded_tags(self):
+        """
+        Test events with excluded keywords are left out of listings with
+        the same queries however many keywords are excluded.
+        """
+        keywords = [Keyword.objects.create(title="Excluded %d" % i) for i in range(3)]
+        self.event.keywords.create(keyword=keywords[0])
+        keyword_ids = [keyword.id for keyword in keywords]
+        url = reverse("event_list")
+        params = {"format": "json", "fields": "id"}
+        self.client.get(url, params)
+        query_counts = []
+        for tag_ids in (keyword_ids[:1], keyword_ids + [0]):
+            with override_settings(EVENT_EXCLUDE_TAG_LIST=tag_ids):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url, params)
+                    data = json.loads(b"".join(response.streaming_content).decode("utf-8"))
+                query_counts.append(len(context))
+                self.assertEqual([event["id"] for event in data["events"]],
+                                 [self.unicode_event.id])
+                template = Template("{% load event_tags %}"
+                                    "{{ excluded|tag_is_excluded }} {{ kept|tag_is_excluded }}")
+                self.assertEqual(template.render(Context({"excluded": keyword_ids[0],
+                                                          "kept": self.event.id + 1000})),
+                                 "True False")
+        self.assertEqual(query_counts[0], query_counts[1])
+        keywords[0].delete()
+        with override_settings(EVENT_EXCLUDE_TAG_LIST=keyword_ids[:1]):
+            template = Template("{% load event_tags %}{{ excluded|tag_is_excluded }}")
+            self.assertEqual(template.render(Context({"excluded": keyword_ids[0]})), "False")
+        clear_excluded_keyword_ids()
+
+    def test_filter_choices(self):
+        """
+        Test the filter form choices are cached until a category or
+        location changes, and list each location title once.
+        """
+        for room in ("A", "B"):
+            EventLocation.objects.create(title="Hall", address="1 Hall St", room=room)
+        choices = EventFilterForm().fields["event_locations_filter"].choices
+        self.assertEqual([title for title, label in choices].count("Hall"), 1)
+        with self.assertNumQueries(0):
+            EventFilterForm()
+        # Categories only drop the filter choices and facets.
+        template = Template("{% load event_tags %}{% event_months as months %}")
+        template.render(Context())
+        EventCategory.objects.create(name="Concert")
+        with self.assertNumQueries(0):
+            template.render(Context())
+        choices = EventFilterForm().fields["event_categories_filter"].choices
+        self.assertIn(("Concert", "Concert"), choices)
+        # Locations only drop the cached values of their site.
+        other_site = Site.objects.create(domain="other.example.com")
+        key = site_cache_key("event_months", site_id=other_site.id)
+        EventLocation.objects.create(title="Studio", address="1 Studio St")
+        self.assertEqual(site_cache_key("event_months", site_id=other_site.id), key)
+
+    def test_event_facets(self):
+        """
+        Test events are counted per category, location and keyword with
+        a query per facet, and filter choices without events are hidden.
+        """
+        category = EventCategory.objects.create(name="Concert")
+        EventCategory.objects.create(name="Lecture")
+        Event.objects.filter(id=self.event.id).update(category=category)
+        EventLocation.objects.filter(id=self.eventlocation.id).update(title="Hall")
+        EventLocation.objects.filter(id=self.unicode_eventlocation.id).update(title="Studio")
+        keyword = Keyword.objects.create(title="Jazz")
+        self.event.keywords.create(keyword=keyword)
+        with self.assertNumQueries(3):
+            facets = event_facets(Event.objects.published())
+        self.assertEqual(facets["categories"], {"Concert": 1})
+        self.assertEqual(facets["locations"], {"Hall": 1, "Studio": 1})
+        self.assertEqual(facets["keywords"],
+                         [{"title": "Jazz", "slug": keyword.slug, "event_count": 1}])
+        # Selecting a location keeps the other locations as choices.
+        response = self.client.get(reverse("event_list"), {"event_locations_filter": "Hall"})
+        self.assertEqual(response.context["facets"]["locations"], {"Hall": 1, "Studio": 1})
+        form = response.context["filter_form"]
+        self.assertEqual(form.fields["event_categories_filter"].choices,
+                         [("Concert", "Concert (1)")])
+        self.assertEqual(form.fields["event_locations_filter"].choices,
+                         [("Hall", "Hall (1)"), ("Studio", "Studio (1)")])
+        response = self.client.get(reverse("event_list"), {"event_categories_filter": "Concert"})
+        self.assertEqual(response.context["facets"]["locations"], {"Hall": 1})
+        self.assertEqual(response.context["facets"]["categories"], {"Concert": 1})
+
+    @override_settings(EVENT_PAST_EVENTS_LIMIT=2)
+    def test_past_events(self):
+        """
+        Test past events are published ones, newest first and capped.
+        """
+        past = []
+        for days, status in ((3, CONTENT_STATUS_PUBLISHED), (2, CONTENT_STATUS_PUBLISHED),
+                             (1, CONTENT_STATUS_DRAFT), (4, CONTENT_STATUS_PUBLISHED)):
+            start = datetime.now() - timedelta(days=days)
+            past.append(Event.objects.create(title="Past %d" % days, slug="past-%d" % days,
+                                             start=start, end=start + timedelta(hours=2),
+                                             status=status, user=self._user))
+        response = self.client.get(reverse("event_list_past"))
+        self.assertEqual(list(response.context["past_events"]), [past[1], past[0]])
+        self.assertContains(response, past[1].title)
+        self.assertNotContains(response, past[3].title)
+
+    def test_archive_seasons(self):
+        """
+        Test archives resolve seasons from memory without writing any,
+        and see season changes made by any process.
+        """
+        Season.objects.create(title="Season 2000", start=date(2000, 9, 1), end=date(2001, 6, 30))
+        self.assertEqual(Season.for_year(2000).title, "Season 2000")
+        self.client.get(reverse("event_list_year", args=(1990,)))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("event_list_year", args=(1990,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query["sql"] for query in context.captured_queries
+                          if "mezzanine_agenda_season" in query["sql"]
+                          or not query["sql"].startswith("SELECT")])
+        self.assertFalse(Season.objects.filter(start__year=1990).exists())
+        Season.objects.filter(start__year=2000).delete()
+        self.assertEqual(Season.for_year(2000).start, date(2000, 7, 31))
+        # Seasons changed by another process are read again too.
+        Season.objects.bulk_create([Season(title="Season 2002", start=date(2002, 9, 1),
+                                           end=date(2003, 6, 30))])
+        self.assertEqual(Season.for_year(2002).start, date(2002, 7, 31))
+        cache.set("mezzanine_agenda.generation.scope.seasons", "other process")
+        self.assertEqual(Season.for_year(2002).title, "Season 2002")
+
+    def test_date_windows(self):
+        """
+        Test filtering events overlapping a window matches overlapping
+        them in Python, for events with or without end, spanning or
+        touching the window bounds.
+        """
+        Event.objects.all().delete()
+        base = day_start(date(2017, 12, 31))
+        spans = (None, timedelta(0), timedelta(hours=2), timedelta(days=1),
+                 timedelta(days=3), timedelta(days=40), timedelta(days=400))
+        events = []
+        for offset in (-400, -40, -7, -1, 0, 1, 2, 7, 30, 31, 32, 200, 365, 366):
+            for hours in (0, 23):
+                for span in spans:
+                    start = base + timedelta(days=offset, hours=hours)
+                    events.append(Event.objects.create(
+                        title="Window", start=start, end=start + span if span is not None else None,
+                        status=CONTENT_STATUS_PUBLISHED, user=self._user))
+        windows = [year_window(2018), year_window(2017), month_window(2018, 1),
+                   month_window(2018, 2), week_window(2018, 1), day_window(2018, 1, 1),
+                   day_window(2017, 12, 31), season_window(Season.for_year(2017)),
+                   upcoming_window(base + timedelta(days=1))]
+        def overlaps(event, window):
+            starts_before_end = window.end is None or event.start < window.end
+            return starts_before_end and (event.end or event.start) >= window.start
+        for window in windows:
+            expected = set(event.id for event in events if overlaps(event, window))
+            self.assertEqual(set(overlapping(Event.objects.all(), window).values_list("id", flat=True)),
+                             expected, window)
+        # Multi-day events are listed in every window they overlap.
+        window = week_window(2018, 1)
+        response = self.client.get(reverse("event_list_week", args=(2018, 1)))
+        listed = set(event.id for event in response.context["object_list"])
+        self.assertEqual(listed, set(event.id for event in events if overlaps(event, window)))
+        self.assertTrue([event for event in events
+                         if event.id in listed and event.start < window.start])
+        self.assertEqual(self.client.get(reverse("event_list_month", args=(2018, 13))).status_code,
+                         404)
+
+    def test_archive_months(self):
+        """
+        Test month and day archives list the months of both calendar
+        years of a season, including a month in both of them.
+        """
+        Event.objects.all().delete()
+        october, march = [Event.objects.create(
+            title=title, start=start, end=start + timedelta(hours=2),
+            status=CONTENT_STATUS_PUBLISHED, user=self._user)
+            for title, start in (("October", datetime(2015, 10, 10, 20)),
+                                 ("March", datetime(2016, 3, 15, 20)))]
+        for args, expected in (((2015, 10), [october]), ((2015, 3), [march]),
+                               ((2015, 4), [])):
+            response = self.client.get(reverse("event_list_month", args=args))
+            self.assertEqual(list(response.context["object_list"]), expected)
+        response = self.client.get(reverse("event_list_day", args=(2015, 3, 15)))
+        self.assertEqual(list(response.context["object_list"]), [march])
+        self.assertEqual(response.context["day_date"], date(2016, 3, 15))
+        response = self.client.get(reverse("event_list_day", args=(2015, 3, 16)))
+        self.assertEqual(list(response.context["object_list"]), [])
+        # July is in both years of the default season, from July 31st.
+        july = [Event.objects.create(
+            title="July", start=start, end=start + timedelta(hours=2),
+            status=CONTENT_STATUS_PUBLISHED, user=self._user)
+            for start in (datetime(2015, 7, 31, 20), datetime(2016, 7, 15, 20))]
+        response = self.client.get(reverse("event_list_month", args=(2015, 7)))
+        self.assertEqual(list(response.context["object_list"]), july)
+        response = self.client.get(reverse("event_list_day", args=(2015, 7, 15)))
+        self.assertEqual(list(response.context["object_list"]), [july[1]])
+        self.assertEqual(response.context["day_date"], date(2016, 7, 15))
+
+    def test_dataset_seed(self):
+        """
+        Test a seed generates the same dataset again in a database
+        holding a previous one, with slugs unique to each run.
+        """
+        def dataset():
+            counts = generate_dataset(events=20, locations=2, rooms=1, categories=2,
+                                      keywords=3, prices=2, seasons=1, seed=1)
+            events = Event.objects.filter(slug__startswith="agenda-dataset-").order_by("-id")
+            events = events.select_related("location", "category")[:counts["events"]]
+            return counts, sorted((re.sub(r"^agenda-dataset-\d+-", "", event.slug),
+                                   event.location.title, event.category.name,
+                                   event.keywords_string) for event in events)
+        first, second = dataset(), dataset()
+        self.assertEqual(first, second)
+        for model in (Event, EventLocation, Keyword):
+            slugs = model.objects.filter(slug__startswith="agenda-dataset-").values_list(
+                "slug", flat=True)
+            self.assertEqual(len(slugs), len(set(slugs)))
+        self.assertEqual(EventLocation.objects.filter(
+            slug__startswith="agenda-dataset-").count(), 4)
+
+    def test_location_list(self):
+        """
+        Test locations are listed once per room with their upcoming
+        event count, in a single query.
+        """
+        rooms = [EventLocation.objects.create(title="Hall", address="Hall", room=room)
+                 for room in ("A", "A", "B", "", None)]
+        now = datetime.now()
+        for start, status, location in ((now + timedelta(days=1), CONTENT_STATUS_PUBLISHED, rooms[0]),
+                                        (now + timedelta(days=2), CONTENT_STATUS_PUBLISHED, rooms[0]),
+                                        (now - timedelta(days=2), CONTENT_STATUS_PUBLISHED, rooms[0]),
+                                        (now + timedelta(days=1), CONTENT_STATUS_DRAFT, rooms[2]),
+                                        (now + timedelta(days=1), CONTENT_STATUS_PUBLISHED, rooms[1])):
+            Event.objects.create(title="Room", start=start, end=start + timedelta(hours=2),
+                                 location=location, status=status, user=self._user)
+        with self.assertNumQueries(1):
+            locations = list(LocationListView().get_queryset())
+        self.assertEqual(set(locations), set([self.eventlocation, self.unicode_eventlocation,
+                                              rooms[0], rooms[2], rooms[3], rooms[4]]))
+        counts = dict((location.id, location.upcoming_event_count) for location in locations)
+        self.assertEqual(counts[rooms[0].id], 2)
+        self.assertEqual(counts[rooms[2].id], 0)
+        self.assertEqual(counts[self.eventlocation.id], 1)
+        with override_settings(EVENT_LOCATIONS_PER_PAGE=2):
+            view = LocationListView()
+            self.assertEqual(view.get_paginate_by(view.get_queryset()), 2)
+
+    def test_event_locations_authors(self):
+        """
+        Test the location and author aggregates are cached until an
+        event changes, and can be restricted to upcoming events.
+        """
+        hall = EventLocation.objects.create(title="Hall", address="1 Hall St")
+        start = datetime.now() - timedelta(days=3)
+        past = Event.objects.create(title="Past", start=start, end=start + timedelta(hours=2),
+                                    location=hall, status=CONTENT_STATUS_PUBLISHED, user=self._user)
+        template = Template("{% load event_tags %}{% event_locations as locations %}"
+                            "{% event_authors as authors %}"
+                            "{% for location in locations %}{{ location.title }}:"
+                            "{{ location.event_count }} {% endfor %}"
+                            "{% for author in authors %}{{ author }}:{{ author.event_count }} {% endfor %}")
+        invalidate_site()
+        rendered = template.render(Context())
+        self.assertIn("Hall:1", rendered)
+        self.assertIn("%s:3" % self._user, rendered)
+        with self.assertNumQueries(0):
+            self.assertEqual(template.render(Context()), rendered)
+        past.status = CONTENT_STATUS_DRAFT
+        past.save()
+        rendered = template.render(Context())
+        self.assertNotIn("Hall:", rendered)
+        self.assertIn("%s:2" % self._user, rendered)
+        past.status = CONTENT_STATUS_PUBLISHED
+        past.save()
+        template = Template("{% load event_tags %}"
+                            "{% event_locations upcoming=True as locations %}"
+                            "{% event_locations upcoming=True limit=1 as top %}"
+                            "{% event_authors upcoming=True as authors %}"
+                            "{% for location in locations %}{{ location.id }} {% endfor %}|"
+                            "{{ top|length }}|{% for author in authors %}"
+                            "{{ author }}:{{ author.event_count }}{% endfor %}")
+        locations, top, authors = template.render(Context()).split("|")
+        self.assertEqual(set(locations.split()),
+                         set([str(self.eventlocation.id), str(self.unicode_eventlocation.id)]))
+        self.assertEqual(top, "1")
+        self.assertEqual(authors, "%s:2" % self._user)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Count the queries of agenda URLs and template tags against two
+    generated datasets. Counts must stay within the budgets below and
+    mustn't grow with the number of events, which is how N+1 queries
+    in views, feeds and templates show up.
+    """
+
+    sizes = (30, 90)
+
+    def setUp(self):
+        super(QueryBudgetTests, self).setUp()
+        Season.clear_cache()
+
+    # The location and booking views aren't budgeted as the app doesn't
+    # ship their templates.
+    url_budgets = {
+        "event_list": 30,
+        "event_list_tag": 30,
+        "event_list_location": 30,
+        "event_list_author": 30,
+        "event_list_week": 30,
+        "event_list_year": 30,
+        "event_list_month": 30,
+        "event_list_day": 30,
+        "event_detail": 25,
+        "icalendar": 10,
+        "icalendar_tag": 10,
+        "icalendar_location": 10,
+        "icalendar_author": 10,
+        "icalendar_year": 10,
+        "icalendar_month": 10,
+        "icalendar_event": 10,
+        "event_feed rss": 10,
+        "event_feed atom": 10,
+        "event_feed_tag": 10,
+        "event_feed_location": 10,
+        "event_feed_author": 10,
+        "event-price-autocomplete": 5,
+    }
+
+    tag_budgets = {
+        "event_months": 1,
+        "event_locations": 1,
+        "event_authors": 1,
+        "recent_events": 1,
+        "upcoming_events": 1,
+        "google_calendar_url": 1,
+        "google_nav_url": 0,
+        "google_static_map": 0,
+        "icalendar_url": 0,
+        "all_events": 1,
+        "all_days": 1,
+        "events_in_day": 1,
+        "month_event_days": 1,
+        "week_event_days": 1,
+        "season_event_days": 1,
+        "all_weeks": 1,
+        "event_calendar": 1,
+        "event_week_calendar": 1,
+        "week_range": 0,
+        "tag_is_excluded": 0,
+        # Every keyword of events is read at once.
+        "get_tag": 1,
+        "date_format": 0,
+    }
+
+    def capture(self, func):
+        """
+        Return the queries ``func`` runs with empty agenda caches.
+        """
+        invalidate_site()
+        clear_site_domains()
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return context.captured_queries
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertIn(response.status_code, (200, 302), path)
+        if response.streaming:
+            b"".join(response.streaming_content)
+
+    def dataset_queries(self, size):
+        """
+        Generate a dataset of ``size`` events and return the queries
+        of every budgeted URL and tag, rolling the dataset back after.
+        """
+        queries = {}
+        with transaction.atomic():
+            generate_dataset(events=size, locations=3, rooms=2, keywords=5,
+                             seasons=1, seed=size)
+            self.client.force_login(Event.objects.filter(
+                slug__startswith="agenda-dataset-")[0].user)
+            for name, path in dataset_urls():
+                if name in self.url_budgets:
+                    queries[name] = self.capture(lambda: self.get(path))
+            context = dataset_tag_context(limit=5)
+            for name, source in TAG_TEMPLATES:
+                template = Template("{% load event_tags %}" + source)
+                queries[name] = self.capture(lambda: template.render(Context(context)))
+            self.client.logout()
+            transaction.set_rollback(True)
+        return queries
+
+    def test_query_budgets(self):
+        budgets = dict(self.url_budgets, **self.tag_budgets)
+        small, large = [self.dataset_queries(size) for size in self.sizes]
+        self.assertEqual(set(large), set(budgets))
+        for name, queries in sorted(large.items()):
+            sql = "\n".join(query["sql"] for query in queries)
+            with self.subTest(name=name):
+                self.assertLessEqual(len(queries), budgets[name],
+                    "%s ran %d queries, over its budget of %d:\n%s" % (
+                        name, len(queries), budgets[name], sql))
+                self.assertLessEqual(len(queries), len(small[name]),
+                    "%s ran %d queries with %d events and %d with %d events:\n%s" % (
+                        name, len(small[name]), self.sizes[0], len(queries),
+                        self.sizes[1], sql))
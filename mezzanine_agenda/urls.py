@@ -68,6 +68,7 @@ urlpatterns = [
             EventBookingPassView.as_view(), name="event_pass"),
     url("^archive/(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})%s$" % _slash,
         ArchiveListView.as_view(), name="event_list_day"),
+    url("^past%s$" % _slash, past_events, name="event_list_past"),
     url("^locations/$", LocationListView.as_view(), name="location-list"),
     url("^locations/(?P<slug>.*)%s$" % _slash,
         LocationDetailView.as_view(), name="location-detail"),
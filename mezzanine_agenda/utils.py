@@ -3,8 +3,46 @@
 import hashlib
 import hmac
 import base64
+from datetime import time, timedelta
 from urllib.parse import urlparse
-from django.conf import settings
+
+import pytz
+
+from django.utils import timezone
+
+from mezzanine.conf import settings
+
+
+def get_event_timezone():
+    """
+    Return the time zone event dates are written in, falling back to
+    the default time zone if ``EVENT_TIME_ZONE`` isn't set.
+    """
+    if settings.EVENT_TIME_ZONE != "":
+        return pytz.timezone(settings.EVENT_TIME_ZONE)
+    return timezone.get_default_timezone()
+
+
+def event_days(start, end=None):
+    """
+    Return the days an event from ``start`` to ``end`` covers in the
+    event time zone. An event ending at midnight doesn't cover the day
+    it ends on.
+    """
+    app_timezone = get_event_timezone()
+    first = timezone.localtime(start, app_timezone) if timezone.is_aware(start) else start
+    last = first
+    if end and end > start:
+        last = timezone.localtime(end, app_timezone) if timezone.is_aware(end) else end
+    last_day = last.date()
+    if last.time() == time(0) and last_day > first.date():
+        last_day -= timedelta(days=1)
+    days = []
+    day = first.date()
+    while day <= last_day:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
 
 
 def sign_url(input_url=None, secret=None):
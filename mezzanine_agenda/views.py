@@ -1,46 +1,113 @@
 from __future__ import unicode_literals
 from future.builtins import str
 from future.builtins import int
-from calendar import month_name, day_name, monthrange
-from datetime import datetime, date, timedelta, time
+import json
+from functools import reduce
+from operator import or_
+from calendar import month_name, day_name
+from datetime import datetime, date
 
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
-from django.db.models import Q
-from django.http import Http404, HttpResponse, JsonResponse
+from django.db.models import Case, Count, IntegerField, Max, Min, Q, Sum, When
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.translation import get_language
 from django.views.generic import *
 from django.views.generic.base import *
-from django.core import serializers
+from django.views.decorators.http import condition
+from django.core.serializers.json import DjangoJSONEncoder
 from icalendar import Calendar
 from dal import autocomplete
 
 from mezzanine_agenda import __version__
 from mezzanine_agenda.models import Event, EventLocation, EventShop, Season, EventPrice
-from mezzanine_agenda.feeds import EventsRSS, EventsAtom
+from mezzanine_agenda.feeds import EventsRSS, EventsAtom, feed_events
 from mezzanine.conf import settings
-from mezzanine.generic.models import Keyword
+from mezzanine.generic.models import AssignedKeyword, Keyword
 from mezzanine.pages.models import Page
 from mezzanine.utils.views import render, paginate
 from mezzanine.utils.models import get_user_model
 from mezzanine.utils.sites import current_site_id
 
+from mezzanine_agenda.cache import cached_fragments, cached_for_site, get_excluded_keyword_ids, \
+    site_generation
+from mezzanine_agenda.facets import cached_event_facets
 from mezzanine_agenda.forms import EventFilterForm
+from mezzanine_agenda.pagination import keyset_paginate, page_querystring
+from mezzanine_agenda.windows import (day_window, days_window, month_window, overlap_condition,
+                                      overlapping, season_window, upcoming_window,
+                                      week_window, year_window)
 
 
 User = get_user_model()
 
 
-def next_weekday(d, weekday):
-    days_ahead = weekday - d.weekday()
-    if days_ahead <= 0: # Target day already happened this week
-        days_ahead += 7
-    return d + timedelta(days_ahead)
+def exclude_keywords(events, keyword_ids):
+    """
+    Exclude the events tagged with any of the keywords with a single
+    subquery on assigned keywords, however many keywords there are.
+    """
+    if not keyword_ids:
+        return events
+    assigned = AssignedKeyword.objects.filter(
+        content_type=ContentType.objects.get_for_model(Event),
+        keyword_id__in=keyword_ids)
+    return events.exclude(id__in=assigned.values("object_pk"))
+
+
+# Event fields the JSON listings can return, and those returned by default.
+JSON_FIELDS = ("id", "title", "sub_title", "slug", "url", "start", "end", "date_text",
+               "description", "content", "mentions", "location", "category", "parent",
+               "user", "rank", "is_full", "external_id", "keywords_string",
+               "publish_date", "updated")
+JSON_DEFAULT_FIELDS = ("id", "title", "url", "start", "end", "location")
+
+
+def _events_json(request, page, fields):
+    """
+    Yield the JSON of a page of events one event at a time, along with
+    the URLs of the next and previous pages. Related objects
+    are returned as their id.
+    """
+    page_url = lambda name, value: "%s?%s" % (request.path,
+                                              page_querystring(request.GET, name, value))
+    next = previous = None
+    if getattr(page, "keyset", False):
+        if page.has_next():
+            next = page_url("after", page.next_cursor)
+        if page.has_previous():
+            previous = page_url("before", page.previous_cursor)
+    else:
+        if page.has_next():
+            next = page_url("page", page.next_page_number())
+        if page.has_previous():
+            previous = page_url("page", page.previous_page_number())
+    yield '{"next": %s, "previous": %s, "events": [' % (json.dumps(next), json.dumps(previous))
+    for i, event in enumerate(page.object_list):
+        values = {}
+        for field in fields:
+            if field == "url":
+                values[field] = event.get_absolute_url()
+            else:
+                values[field] = getattr(event, Event._meta.get_field(field).attname)
+        yield ("," if i else "") + json.dumps(values, cls=DjangoJSONEncoder)
+    yield "]}"
 
-def week_day_range(year, week):
-    first_day = date(int(year),1,1)
-    lower_date = next_weekday(first_day, 0) + timedelta(weeks=int(week)-1)
-    higher_date = lower_date + timedelta(days=int(6))
-    return lower_date, higher_date
+
+def paginate_events(request, events, descending=False):
+    """
+    Paginate events with page numbers, or with ``after`` and ``before``
+    cursors in the query string if ``EVENT_PAGINATION`` is
+    ``"keyset"``, in which case they're ordered by start date.
+    """
+    if settings.EVENT_PAGINATION == "keyset":
+        return keyset_paginate(events, settings.EVENT_PER_PAGE,
+                               after=request.GET.get("after"),
+                               before=request.GET.get("before"),
+                               descending=descending)
+    return paginate(events, request.GET.get("page", 1),
+                    settings.EVENT_PER_PAGE, settings.MAX_PAGING_LINKS)
 
 
 class EventListView(ListView):
@@ -56,17 +123,36 @@ class EventListView(ListView):
     form_initial = {}
 
     def get(self, request, *args, **kwargs):
-        response = super(EventListView, self).get(request, *args, **kwargs)
-        # AJAX
-        if request.is_ajax():
-            object_list_json = serializers.serialize('json', self.object_list)
-            reponse = JsonResponse(object_list_json, safe=False)
-        return response
+        if request.is_ajax() or request.GET.get("format") == "json":
+            self.object_list = self.get_queryset()
+            return self.render_to_json_response()
+        return super(EventListView, self).get(request, *args, **kwargs)
+
+    def render_to_json_response(self):
+        """
+        Stream a page of the events as JSON. The ``fields`` query string
+        argument is a comma separated list of the fields returned, the
+        only ones read from the database, out of ``JSON_FIELDS``.
+        """
+        fields = self.request.GET.get("fields")
+        fields = fields.split(",") if fields else JSON_DEFAULT_FIELDS
+        unknown = set(fields) - set(JSON_FIELDS)
+        if unknown:
+            return JsonResponse({"error": "Unknown fields: %s" % ", ".join(sorted(unknown))},
+                                status=400)
+        columns = set(fields) - set(["url"])
+        if "url" in fields:
+            columns.update(("slug", "publish_date"))
+        events = self.object_list.select_related(None).prefetch_related(None)
+        page = paginate_events(self.request, events.only("start", *columns))
+        return StreamingHttpResponse(_events_json(self.request, page, fields),
+                                     content_type="application/json")
 
     def get_queryset(self, tag=None):
         settings.use_editable()
         self.templates = []
         self.day_date = None
+        self.form_initial = {}
         events = None
         self.tag = None if "tag" not in self.kwargs else self.kwargs['tag']
         self.year = None if "year" not in self.kwargs else self.kwargs['year']
@@ -86,28 +172,26 @@ class EventListView(ListView):
             self.tag = get_object_or_404(Keyword, slug=self.tag)
             events = events.filter(keywords__keyword=self.tag)
         else:
-            for exclude_tag_id in settings.EVENT_EXCLUDE_TAG_LIST:
-                exclude_tag = get_object_or_404(Keyword, id=exclude_tag_id)
-                events = events.exclude(keywords__keyword=exclude_tag)
+            events = exclude_keywords(events, get_excluded_keyword_ids())
 
         # if not day:
         #     events = events.filter(parent=None)
         if self.year is not None:
-            events = events.filter(start__year=self.year)
-            if self.month is not None:
-                events = events.filter(start__month=self.month)
-                try:
-                    month_orig = self.month
-                    self.month = month_name[int(self.month)]
-                except IndexError:
-                    raise Http404()
+            try:
                 if self.day is not None:
-                    events = events.filter(start__day=self.day)
-                    self.day_date = date(year=int(self.year), month=int(month_orig), day=int(self.day))
-            elif self.week is not None:
-                events = events.filter(start__year=self.year)
-                lower_date, higher_date = week_day_range(self.year, self.week)
-                events = events.filter(start__range=(lower_date, higher_date))
+                    window = day_window(self.year, self.month, self.day)
+                    self.day_date = window.start.date()
+                elif self.month is not None:
+                    window = month_window(self.year, self.month)
+                elif self.week is not None:
+                    window = week_window(self.year, self.week)
+                else:
+                    window = year_window(self.year)
+            except ValueError:
+                raise Http404()
+            events = overlapping(events, window)
+            if self.month is not None:
+                self.month = month_name[int(self.month)]
         if self.location is not None:
             self.location = get_object_or_404(EventLocation, slug=self.location)
             events = events.filter(location=self.location)
@@ -121,18 +205,24 @@ class EventListView(ListView):
 
         if not self.year and not self.location and not self.username:
             #Get upcoming events/ongoing events
-            events = events.filter(Q(start__gt=datetime.now()) | Q(end__gt=datetime.now()))
+            events = overlapping(events, upcoming_window())
+
+        # Facets are counted without their own filter.
+        self.facet_events = events
+        self.facet_filters = {}
 
         # Filter by locations
         event_locations_filter = self.request.GET.getlist('event_locations_filter')
         if event_locations_filter:
-            events = events.filter(location__title__in=event_locations_filter)
+            self.facet_filters['locations'] = Q(location__title__in=event_locations_filter)
+            events = events.filter(self.facet_filters['locations'])
             self.form_initial['event_locations_filter'] = event_locations_filter
 
         # Filter by categories
         event_categories_filter = self.request.GET.getlist('event_categories_filter')
         if event_categories_filter:
-            events = events.filter(category__name__in=event_categories_filter)
+            self.facet_filters['categories'] = Q(category__name__in=event_categories_filter)
+            events = events.filter(self.facet_filters['categories'])
             self.form_initial['event_categories_filter'] = event_categories_filter
 
         prefetch = ("keywords__keyword",)
@@ -142,12 +232,17 @@ class EventListView(ListView):
 
     def get_context_data(self, *args, **kwargs):
         context = super(EventListView, self).get_context_data(**kwargs)
+        context["events"] = paginate_events(self.request, self.object_list)
         context.update({"year": self.year, "month": self.month, "day": self.day, "week": self.week,
                "tag": self.tag, "location": self.location, "author": self.author, 'day_date': self.day_date, 'is_archive' : False})
 
-        context['filter_form'] = EventFilterForm(initial=self.form_initial)
+        context['facets'] = cached_event_facets(self.request, self.facet_events,
+                                                self.facet_filters)
+        context['filter_form'] = EventFilterForm(initial=self.form_initial,
+                                                 facets=context['facets'])
         if settings.PAST_EVENTS:
-            context['past_events'] = Event.objects.filter(end__lt=datetime.now()).order_by("start")
+            # Only read if the template uses it.
+            context['past_events'] = get_past_events
 
         return context
 
@@ -179,53 +274,79 @@ class ArchiveListView(ListView):
         self.year = date_now.year if ("year" not in self.kwargs or self.kwargs['year'] is None) else self.kwargs['year']
         self.month = None if "month" not in self.kwargs else self.kwargs['month']
         self.day = None if "day" not in self.kwargs else self.kwargs['day']
+        self.descending = self.month is None
         digit_year = int(self.year)
         events = Event.objects.published(for_user=self.request.user)
         if self.year is not None:
             # we suppose that self.year corresponds to start year of a season
-            season, created = Season.objects.get_or_create(
-                start__year=digit_year,
-                defaults={'title' : 'Season ' + str(self.year) + '-' + str(digit_year + 1),
-                          'start' : date(digit_year, 7, 31),
-                          'end' : date(digit_year + 1, 8, 1)})
+            season = Season.for_year(digit_year)
+            window = season_window(season)
             # if current season, max date is the current date, not whole season
             if date_now.year == season.start.year or digit_year == season.end.year:
-                date_max = date_now
-                date_max = date_max.replace(hour=23, minute=59, second=59)
-            else:
-                date_max = season.end
-                date_max = datetime.combine(date_max, time(23, 59, 59))
-
-            season.start = datetime.combine(season.start, time(0, 0, 0))
-            events = events.filter(start__range=[season.start, date_max]).order_by("-start")
+                window = days_window(season.start, min(season.end, date_now.date()))
+            events = overlapping(events, window).order_by("-start")
 
             if self.month is not None:
-                digit_month = int(self.month)
-                first_day_in_month = date(digit_year, digit_month, 1)
-                last_day_in_month = date(digit_year, digit_month,  monthrange(digit_year, digit_month)[1])
-                # works for periods containing the month or a period in the month
-                events = events.filter((Q(start__lt=first_day_in_month)
-                                       & Q(end__gt=last_day_in_month))
-                                       | Q(start__range=(first_day_in_month, last_day_in_month))
-                                       | Q(end__month=self.month)
-                                       | Q(start__month=self.month)).order_by("start")
+                # A month can be in both years of a season, such as July
+                # in a season running from July to July.
+                years = range(season.start.year, season.end.year + 1)
+                month = int(self.month)
                 try:
-                    month_orig = self.month
-                    self.month = month_name[int(self.month)]
-                except IndexError:
+                    self.month = month_name[month]
+                    if self.day is not None:
+                        days = []
+                        for year in years:
+                            try:
+                                days.append(date(year, month, int(self.day)))
+                            except ValueError:
+                                pass
+                        in_season = [day for day in days if season.start <= day <= season.end]
+                        self.day_date = (in_season or days)[0]
+                        windows = [window.intersection(days_window(self.day_date, self.day_date))]
+                    else:
+                        windows = [window.intersection(month_window(year, month)) for year in years]
+                except (IndexError, ValueError):
                     raise Http404()
-                if self.day is not None:
-                    events = events.filter(start__day=self.day)
-                    self.day_date = date(year=digit_year, month=int(month_orig), day=int(self.day))
+                windows = [part for part in windows if not part.is_empty()]
+                if not windows:
+                    events = events.none()
+                else:
+                    events = events.filter(reduce(or_, map(overlap_condition, windows)))
+                events = events.order_by("start")
 
         return events
 
     def get_context_data(self, *args, **kwargs):
         context = super(ArchiveListView, self).get_context_data(**kwargs)
+        context["events"] = paginate_events(self.request, self.object_list,
+                                            descending=self.descending)
         context.update({"year": self.year, "month": self.month, "day": self.day, 'day_date': self.day_date, 'is_archive': True})
         return context
 
 
+def get_past_events():
+    """
+    Return the ``EVENT_PAST_EVENTS_LIMIT`` latest published events that
+    have ended, newest first, cached per site and language for
+    ``EVENT_PAST_EVENTS_CACHE_TIMEOUT`` seconds.
+    """
+    def latest():
+        now = datetime.now()
+        events = Event.objects.published().filter(Q(end__lt=now) | Q(end__isnull=True, start__lt=now))
+        events = events.select_related("location").order_by("-start", "-id")
+        return list(events[:settings.EVENT_PAST_EVENTS_LIMIT])
+    return cached_for_site("past_events", latest, parts=(get_language(),),
+                           timeout=settings.EVENT_PAST_EVENTS_CACHE_TIMEOUT)
+
+
+def past_events(request, template="agenda/includes/past_events.html"):
+    """
+    Render the past events on their own, for pages to load them after
+    the event listing.
+    """
+    return render(request, template, {"past_events": get_past_events()})
+
+
 def event_detail(request, slug, year=None, month=None, day=None,
                      template="agenda/event_detail.html"):
     """. Custom templates are checked for using the name
@@ -261,6 +382,33 @@ def event_booking(request, slug, year=None, month=None, day=None,
     return render(request, templates, context)
 
 
+def _events_condition(get_events):
+    """
+    Decorator answering conditional GET requests for a view before it
+    runs. The ETag is made of the active language, the site's cache
+    generation, which changes whenever an event or location is saved or
+    deleted, and of the number, id sum and latest update time of the
+    events ``get_events`` returns, which change when events enter or
+    leave the listing without being saved, such as when they expire or
+    end. There's no Last-Modified validator, since events leaving the
+    listing don't move it.
+    """
+    def etag(request, *args, **kwargs):
+        events = get_events(request, *args, **kwargs).order_by().aggregate(
+            count=Count("id"), ids=Sum("id"), updated=Max("updated"))
+        updated = events["updated"]
+        return "%s-%s-%s-%s-%s" % (get_language(), site_generation(), events["count"],
+                                   events["ids"] or 0,
+                                   updated.strftime("%Y%m%d%H%M%S%f") if updated else 0)
+
+    return condition(etag_func=etag)
+
+
+def _feed_events(request, format, **kwargs):
+    return feed_events(**kwargs)
+
+
+@_events_condition(_feed_events)
 def event_feed(request, format, **kwargs):
     """
     Events feeds - maps format to the correct feed view.
@@ -282,6 +430,11 @@ def _make_icalendar():
     return icalendar
 
 
+def _icalendar_event_events(request, slug, **kwargs):
+    return Event.objects.published(for_user=request.user).filter(slug=slug)
+
+
+@_events_condition(_icalendar_event_events)
 def icalendar_event(request, slug, year=None, month=None, day=None):
     """
     Returns the icalendar for a specific event.
@@ -290,32 +443,26 @@ def icalendar_event(request, slug, year=None, month=None, day=None):
                                      for_user=request.user).select_related()
     event = get_object_or_404(events, slug=slug)
 
-    icalendar = _make_icalendar()
-    icalendar_event = event.get_icalendar_event()
-    icalendar.add_component(icalendar_event)
+    return HttpResponse(b"".join(_icalendar_fragments([event])),
+                        content_type="text/calendar")
 
-    return HttpResponse(icalendar.to_ical(), content_type="text/calendar")
 
-
-def icalendar(request, tag=None, year=None, month=None, username=None,
-                   location=None):
+def _icalendar_events(request, tag=None, year=None, month=None,
+                      username=None, location=None):
     """
-    Returns the icalendar for a group of events that are filtered by tag,
-    year, month, author or location.
+    Returns the events of an icalendar filtered by tag, year, month,
+    author or location.
     """
-    settings.use_editable()
     events = Event.objects.published(for_user=request.user)
     if tag is not None:
         tag = get_object_or_404(Keyword, slug=tag)
         events = events.filter(keywords__keyword=tag)
     if year is not None:
-        events = events.filter(start__year=year)
-        if month is not None:
-            events = events.filter(start__month=month)
-            try:
-                month = month_name[int(month)]
-            except IndexError:
-                raise Http404()
+        try:
+            window = month_window(year, month) if month is not None else year_window(year)
+        except ValueError:
+            raise Http404()
+        events = overlapping(events, window)
     if location is not None:
         location = get_object_or_404(EventLocation, slug=location)
         events = events.filter(location=location)
@@ -325,17 +472,41 @@ def icalendar(request, tag=None, year=None, month=None, username=None,
         events = events.filter(user=author)
     if not tag and not year and not location and not username:
         #Get upcoming events/ongoing events
-        events = events.filter(Q(start__gt=datetime.now()) | Q(end__gt=datetime.now())).order_by("start")
+        events = overlapping(events, upcoming_window()).order_by("start")
+    return events.select_related("user", "location")
 
-    prefetch = ("keywords__keyword",)
-    events = events.select_related("user").prefetch_related(*prefetch)
 
-    icalendar = _make_icalendar()
-    for event in events:
-        icalendar_event = event.get_icalendar_event()
-        icalendar.add_component(icalendar_event)
+def _icalendar_fragments(events):
+    """
+    Yields the icalendar for the events one VEVENT at a time, using the
+    cached serialization of each event. The output is the same as
+    serializing the whole calendar at once.
+    """
+    footer = b"END:VCALENDAR\r\n"
+    yield _make_icalendar().to_ical()[:-len(footer)]
+    for fragment in cached_fragments("vevent", events, Event.get_icalendar_cache_key,
+                                     lambda event: event.get_icalendar_event().to_ical()):
+        yield fragment
+    yield footer
 
-    return HttpResponse(icalendar.to_ical(), content_type="text/calendar")
+
+@_events_condition(_icalendar_events)
+def icalendar(request, tag=None, year=None, month=None, username=None,
+                   location=None):
+    """
+    Returns the icalendar for a group of events that are filtered by tag,
+    year, month, author or location.
+    """
+    settings.use_editable()
+    events = _icalendar_events(request, tag=tag, year=year, month=month,
+                               username=username, location=location)
+
+    if settings.EVENT_ICALENDAR_STREAMING:
+        return StreamingHttpResponse(_icalendar_fragments(events.iterator()),
+                                     content_type="text/calendar")
+
+    return HttpResponse(b"".join(_icalendar_fragments(events)),
+                        content_type="text/calendar")
 
 
 class LocationListView(ListView):
@@ -344,17 +515,22 @@ class LocationListView(ListView):
     template_name='agenda/event_location_list.html'
 
     def get_queryset(self):
-        location_list = []
-        room = []
-        locations = self.model.objects.all().order_by('room')
-        for location in locations:
-            if location.room:
-                if not location.room in room:
-                    location_list.append(location)
-                    room.append(location.room)
-            else:
-                location_list.append(location)
-        return location_list
+        """
+        Return the locations without room, and the first location of
+        every room, ordered by room, each annotated with the number of
+        its published upcoming events as ``upcoming_event_count``.
+        """
+        no_room = Q(room__isnull=True) | Q(room="")
+        first_of_rooms = self.model.objects.exclude(no_room).order_by().values("room")
+        first_of_rooms = first_of_rooms.annotate(first_id=Min("id")).values("first_id")
+        upcoming = overlapping(Event.objects.published(), upcoming_window()).values("id")
+        locations = self.model.objects.filter(no_room | Q(id__in=first_of_rooms))
+        return locations.annotate(upcoming_event_count=Sum(Case(
+            When(event__in=upcoming, then=1), default=0, output_field=IntegerField(),
+        ))).order_by("room", "id")
+
+    def get_paginate_by(self, queryset):
+        return settings.EVENT_LOCATIONS_PER_PAGE
 
     def get_context_data(self, **kwargs):
         context = super(LocationListView, self).get_context_data(**kwargs)
@@ -0,0 +1,130 @@
+"""
+Date windows of event listings.
+
+A window runs from the start of its first day up to, but not
+including, the start of the day after its last one, in the event time
+zone. Events are in a window when they overlap it, ie. when::
+
+    start < window end AND coalesce(end, start) >= window start
+
+which ``overlapping`` writes as plain comparisons on ``start`` and
+``end``, so that the database can use its indexes on them. Multi-day
+events are listed in every window they overlap.
+"""
+from __future__ import unicode_literals
+
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from mezzanine.conf import settings
+
+from mezzanine_agenda.utils import get_event_timezone
+
+
+class DateWindow(namedtuple("DateWindow", ("start", "end"))):
+    """
+    A window from the ``start`` datetime up to the ``end`` one, which
+    is excluded. A window without ``end`` is open ended.
+    """
+
+    def contains(self, event_start, event_end=None):
+        """
+        Return whether an event from ``event_start`` to ``event_end``
+        overlaps the window, as ``overlapping`` filters them.
+        """
+        if self.end is not None and event_start >= self.end:
+            return False
+        return (event_end or event_start) >= self.start
+
+    def intersection(self, other):
+        """
+        Return the window covered by both this window and ``other``.
+        """
+        ends = [end for end in (self.end, other.end) if end is not None]
+        return DateWindow(max(self.start, other.start), min(ends) if ends else None)
+
+    def is_empty(self):
+        return self.end is not None and self.end <= self.start
+
+
+def iso_week_range(year, week):
+    """
+    Return the Monday and Sunday of an ISO week.
+    """
+    # The 4th of January is always in the first ISO week.
+    january_4th = date(int(year), 1, 4)
+    monday = january_4th - timedelta(days=january_4th.weekday()) + timedelta(weeks=int(week) - 1)
+    return monday, monday + timedelta(days=6)
+
+
+def day_start(day):
+    """
+    Return the datetime a day starts at in the event time zone.
+    """
+    start = datetime.combine(day, time(0))
+    if settings.USE_TZ:
+        start = timezone.make_aware(start, get_event_timezone())
+    return start
+
+
+def days_window(first_day, last_day):
+    """
+    Return the window covering the days from ``first_day`` to
+    ``last_day`` included.
+    """
+    return DateWindow(day_start(first_day), day_start(last_day + timedelta(days=1)))
+
+
+def year_window(year):
+    return days_window(date(int(year), 1, 1), date(int(year), 12, 31))
+
+
+def month_window(year, month):
+    year, month = int(year), int(month)
+    return days_window(date(year, month, 1), date(year, month, monthrange(year, month)[1]))
+
+
+def day_window(year, month, day):
+    day = date(int(year), int(month), int(day))
+    return days_window(day, day)
+
+
+def week_window(year, week):
+    """
+    Return the window of an ISO week.
+    """
+    return days_window(*iso_week_range(year, week))
+
+
+def season_window(season):
+    return days_window(season.start, season.end)
+
+
+def upcoming_window(now=None):
+    """
+    Return the window of events that haven't ended yet.
+    """
+    if now is None:
+        now = timezone.now() if settings.USE_TZ else datetime.now()
+    return DateWindow(now, None)
+
+
+def overlap_condition(window):
+    """
+    Return the condition of the events overlapping the window.
+    """
+    ends_after = Q(end__gte=window.start) | Q(end__isnull=True, start__gte=window.start)
+    if window.end is None:
+        return ends_after
+    return ends_after & Q(start__lt=window.end)
+
+
+def overlapping(events, window):
+    """
+    Filter the events overlapping the window.
+    """
+    return events.filter(overlap_condition(window))